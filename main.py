@@ -1,12 +1,27 @@
 import argparse
 from dataclasses import dataclass
 
+from src.config import load_config
 from src.extract.download import run_extract
 from src.transform.clean import run_transform
+from src.transform.parallel import run_transform_parallel
 from src.load.build_warehouse import run_load
 from src.marts.hourly_demand import run_mart_hourly_demand
 from src.marts.daily_summary import run_mart_daily_summary
+from src.marts.rolling_windows import run_mart_rolling_demand
+from src.marts.cube import run_cube
+from src.load.snapshots import publish_every, publish_snapshot, snapshot_settings
 from src.pipeline.stage_registry import StageRegistry
+from src.pipeline.transform_load import run_transform_load
+from src.pipeline.watch import run_watch
+from src.pipeline.work_queue import open_queue, run_worker
+
+
+# Stages that run several registry stages in one step
+FUSED_STAGES = {"transform_load": ["transform", "load"]}
+
+# Stages that write the warehouse; a snapshot is published after a run of any of them
+WAREHOUSE_STAGES = {"load", "transform_load", "mart_hourly", "mart_daily", "mart_rolling", "cube"}
 
 
 @dataclass(frozen=True)
@@ -44,21 +59,79 @@ def iter_months(start: YearMonth, end: YearMonth):
             y += 1
 
 
-def run_stage(stage: str, ym: YearMonth):
+def run_stage(stage: str, ym: YearMonth, workers: int | None = None):
     if stage == "extract":
         run_extract(ym.year, ym.month)
     elif stage == "transform":
         run_transform(ym.year, ym.month)
+    elif stage == "transform_parallel":
+        run_transform_parallel(ym.year, ym.month, workers=workers)
     elif stage == "load":
         run_load(ym.year, ym.month)
+    elif stage == "transform_load":
+        run_transform_load(ym.year, ym.month)
     elif stage == "mart_hourly":
         run_mart_hourly_demand()
     elif stage == "mart_daily":
         run_mart_daily_summary()
+    elif stage == "mart_rolling":
+        run_mart_rolling_demand()
+    elif stage == "mart_rolling_check":
+        run_mart_rolling_demand(check=True)
+    elif stage == "cube":
+        run_cube()
     else:
         raise ValueError(f"Unknown stage: {stage}")
 
 
+@dataclass
+class QueuedStageRunner:
+    """
+    Queue worker entry point. Snapshots are batched: one after every
+    `publish_every` warehouse-writing tasks of this worker, published by the
+    last of them while it still holds the queue's single-writer gate, and
+    one from `finish()` once the queue is drained.
+    """
+
+    publish_every: int = 0
+    unpublished: int = 0
+
+    def __call__(self, month_key: str, stage: str):
+        run_stage(stage, parse_year_month(month_key))
+        if stage in WAREHOUSE_STAGES and snapshot_settings().get("enabled", True):
+            self.unpublished += 1
+            if self.publish_every and self.unpublished >= self.publish_every:
+                publish_snapshot()
+                self.unpublished = 0
+
+    def finish(self):
+        if self.unpublished:
+            publish_snapshot()
+            self.unpublished = 0
+
+
+def queued_stages(stage: str) -> list[str]:
+    """
+    Stages queued for `--enqueue`. `all` is never fused here: transforms run
+    in parallel on the workers, only the loads are serialized.
+    """
+    if stage == "all":
+        return ["extract", "transform", "load"]
+    if stage not in ("extract", "transform", "load"):
+        raise SystemExit(f"Error: --enqueue supports extract, transform, load and all, not '{stage}'.")
+    return [stage]
+
+
+def stages_for_all(cfg: dict) -> list[str]:
+    """
+    Stages run by `--stage all`. Transform and load are fused into a single
+    in-process step unless `pipeline.fuse_transform_load` is false.
+    """
+    if cfg.get("pipeline", {}).get("fuse_transform_load", True):
+        return ["extract", "transform_load"]
+    return ["extract", "transform", "load"]
+
+
 def main():
     parser = argparse.ArgumentParser(description="NYC Taxi ETL Pipeline")
 
@@ -72,13 +145,60 @@ def main():
 
     parser.add_argument(
         "--stage",
-        choices=["extract", "transform", "load", "all", "mart_hourly", "mart_daily"],
+        choices=[
+            "extract",
+            "transform",
+            "transform_parallel",
+            "load",
+            "transform_load",
+            "all",
+            "mart_hourly",
+            "mart_daily",
+            "mart_rolling",
+            "mart_rolling_check",
+            "cube",
+            "watch",
+            "worker",
+        ],
         required=True,
         help="Pipeline stage to run",
     )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        help="Seconds between raw directory polls in watch mode (default from config)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for transform_parallel (default from config, else CPU count)",
+    )
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="Add the selected months/stage to the shared work queue instead of running them",
+    )
+    parser.add_argument("--queue", help="Work queue file (default from config)")
+    parser.add_argument("--worker-id", help="Worker name in the work queue (default host:pid)")
 
     args = parser.parse_args()
 
+    # Watch mode runs until stopped and discovers its own months
+    if args.stage == "watch":
+        run_watch(poll_interval=args.poll_interval)
+        return
+
+    # Queue workers run until the shared queue is drained
+    if args.stage == "worker":
+        poll_interval = load_config().get("queue", {}).get("poll_interval_seconds", 2)
+        runner = QueuedStageRunner(publish_every())
+        counts = run_worker(open_queue(args.queue), runner, args.worker_id, poll_interval)
+        runner.finish()
+        print(f"\nQueue drained: {counts}")
+        if counts.get("failed"):
+            raise SystemExit(f"Error: {counts['failed']} queued task(s) failed.")
+        return
+
     # Determine mode
     multi_month = args.start is not None or args.end is not None
     single_month = args.year is not None or args.month is not None
@@ -97,43 +217,61 @@ def main():
             raise SystemExit("Error: --month must be between 1 and 12.")
         months = [YearMonth(args.year, args.month)]
 
+    if args.enqueue:
+        work_queue = open_queue(args.queue)
+        month_keys = [f"{ym.year}-{ym.month:02d}" for ym in months]
+        added = work_queue.enqueue(month_keys, queued_stages(args.stage))
+        print(f"Queued {added} task(s) in {work_queue.path}: {work_queue.counts()}")
+        return
+
     # stages = ["extract", "transform", "load"] if args.stage == "all" else [args.stage]
 
     stage_registry = StageRegistry("data/registry/stage_status.json")
+    all_stages = stages_for_all(load_config())
+    warehouse_written = False
 
     for ym in months:
         month_key = f"{ym.year}-{ym.month:02d}"
 
         # Determine stages for this run
         if args.stage == "all":
-            target_stages = ["extract", "transform", "load"]
+            target_stages = all_stages
         else:
             target_stages = [args.stage]
 
         print(f"\n=== Processing {month_key} | target stages: {', '.join(target_stages)} ===")
 
         for st in target_stages:
+            registry_stages = FUSED_STAGES.get(st, [st])
+
             # Resume logic only for all-stage runs:
-            if args.stage == "all" and stage_registry.is_done(month_key, st):
+            if args.stage == "all" and all(stage_registry.is_done(month_key, rs) for rs in registry_stages):
                 print(f"Skipping {month_key} {st} (already done)")
                 continue
 
             print(f"--> Running {month_key} {st}")
             try:
-                run_stage(st, ym)
+                run_stage(st, ym, workers=args.workers)
             except Exception as e:
                 # Mark failure at the exact stage
                 if args.stage == "all":
-                    stage_registry.mark_failed(month_key, st)
+                    for rs in registry_stages:
+                        stage_registry.mark_failed(month_key, rs)
                     print(f"Marked failed: {month_key} {st}")
                 print(f"!!! Failed at {month_key} {st}: {e}")
                 raise
 
+            warehouse_written = warehouse_written or st in WAREHOUSE_STAGES
+
             # Mark success at the exact stage
             if args.stage == "all":
-                stage_registry.mark_done(month_key, st)
+                for rs in registry_stages:
+                    stage_registry.mark_done(month_key, rs)
                 print(f"Marked done: {month_key} {st}")
 
+    if warehouse_written and snapshot_settings().get("enabled", True):
+        publish_snapshot()
+
     print("\nDone.")
 
 
@@ -0,0 +1,46 @@
+# Run from the project root, e.g.:
+#   python -m scripts.cube_query --by payment_type --where PULocationID=132
+#   python -m scripts.cube_query --by pickup_hour --where "pickup_hour=2023-01-01..2023-01-02" --where payment_type=1,2
+import argparse
+import time
+
+from src.marts.cube import MEASURES, query_cube
+
+
+def parse_value(s: str):
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return float(s)
+        except ValueError:
+            return s
+
+
+def parse_filter(s: str):
+    """COLUMN=VALUE, COLUMN=V1,V2 (IN) or COLUMN=LO..HI (half-open range, either end may be empty)."""
+    column, sep, value = s.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Invalid filter '{s}'. Use COLUMN=VALUE.")
+    if ".." in value:
+        lo, hi = value.split("..", 1)
+        return column, (parse_value(lo) if lo else None, parse_value(hi) if hi else None)
+    if "," in value:
+        return column, [parse_value(v) for v in value.split(",")]
+    return column, parse_value(value)
+
+
+parser = argparse.ArgumentParser(description="Slice/roll-up query answered from the smallest fitting cuboid")
+parser.add_argument("--by", nargs="*", default=[], help="Dimensions (or trip columns) to group by")
+parser.add_argument("--where", type=parse_filter, action="append", default=[], help="Filter, repeatable")
+parser.add_argument("--measures", nargs="+", choices=list(MEASURES), help="Default: all measures")
+args = parser.parse_args()
+
+started = time.perf_counter()
+source, columns, rows = query_cube(args.by, dict(args.where), args.measures)
+elapsed = time.perf_counter() - started
+
+print("\t".join(columns))
+for row in rows:
+    print("\t".join(str(v) for v in row))
+print(f"\n{len(rows)} rows from {source} in {elapsed * 1000:.1f} ms")
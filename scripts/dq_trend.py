@@ -0,0 +1,13 @@
+# Run from the project root: python -m scripts.dq_trend --metric removed_ratio
+import argparse
+
+from src.quality.metrics import TABLE_LEVEL, dq_trend
+
+parser = argparse.ArgumentParser(description="Print one DQ metric across all processed months")
+parser.add_argument("--metric", default="removed_ratio", help="e.g. rows, removed_ratio, null_rate, violations, min, max")
+parser.add_argument("--column", default=TABLE_LEVEL, help="Column (or rule name for --layer rules); '*' for table-level")
+parser.add_argument("--layer", default="cleaned", choices=["raw", "cleaned", "rules", "dedup"])
+args = parser.parse_args()
+
+for month, value in dq_trend(args.metric, args.column, args.layer):
+    print(f"{month}\t{value}")
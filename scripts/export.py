@@ -0,0 +1,27 @@
+# Run from the project root, e.g.:
+#   python -m scripts.export mart_hourly_demand data/exports/hourly.csv.gz --compression gzip
+#   python -m scripts.export "SELECT * FROM yellow_2023_01 WHERE PULocationID = 132" data/exports/jfk.parquet
+import argparse
+
+from src.export.stream import DEFAULT_BATCH_ROWS, FORMATS, export_query
+
+parser = argparse.ArgumentParser(description="Stream a warehouse table, mart or query to a file")
+parser.add_argument("source", help="Table/view/mart name or a SELECT query")
+parser.add_argument("out", help="Output file (or directory with --partition-by / --max-file-size)")
+parser.add_argument("--format", choices=list(FORMATS), help="Defaults to the output file extension")
+parser.add_argument("--compression", help="csv/jsonl: gzip, zstd; parquet: snappy, zstd, gzip; arrow: zstd, lz4")
+parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Parquet row group / Arrow batch size")
+parser.add_argument("--partition-by", nargs="+", help="Write hive-partitioned files by these columns")
+parser.add_argument("--max-file-size", help="Split output into files of about this size, e.g. 256MB")
+args = parser.parse_args()
+
+out = export_query(
+    args.source,
+    args.out,
+    fmt=args.format,
+    batch_rows=args.batch_rows,
+    compression=args.compression,
+    partition_by=args.partition_by,
+    max_file_size=args.max_file_size,
+)
+print(f"Exported to: {out}")
@@ -1,33 +1,32 @@
+# Run from the project root: python -m scripts.export_demo
 import os
-import duckdb
 
-DB_PATH = "data/warehouse/taxi.duckdb"
+from src.export.stream import export_query
+from src.load.snapshots import connect_reader
+
 OUT_PATH = "data/demo/mart_daily_sample.csv"
 
 os.makedirs("data/demo", exist_ok=True)
 
-if not os.path.exists(DB_PATH):
-    raise FileNotFoundError(f"DuckDB warehouse not found: {DB_PATH}")
-
-con = duckdb.connect(DB_PATH)
+# Published snapshot (or the working warehouse if none): never blocks on a running load
+con = connect_reader()
 
 tables = [r[0] for r in con.execute("SHOW TABLES").fetchall()]
 if "mart_daily_summary" not in tables:
     raise RuntimeError(
-        f"mart_daily_summary not found in {DB_PATH}. "
+        "mart_daily_summary not found in the warehouse. "
         f"Available tables: {tables[:20]}... "
         "Run: python main.py --year 2023 --month 1 --stage mart_daily"
     )
 
 query = """
-SELECT *
+SELECT * REPLACE (pickup_day::DATE AS pickup_day)
 FROM mart_daily_summary
 ORDER BY pickup_day
 LIMIT 100
 """
 
-df = con.execute(query).df()
-df.to_csv(OUT_PATH, index=False)
+export_query(query, OUT_PATH, fmt="csv", con=con)
 
 con.close()
-print(f"Demo dataset exported to: {OUT_PATH}")
\ No newline at end of file
+print(f"Demo dataset exported to: {OUT_PATH}")
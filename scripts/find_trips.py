@@ -0,0 +1,40 @@
+# Run from the project root, e.g.:
+#   python -m scripts.find_trips --start "2023-01-15 08:00" --end "2023-01-15 09:00" --pu 132 --do 236
+#   python -m scripts.find_trips --reindex
+import argparse
+import time
+
+from src.lookup.trip_index import find_trips, reindex_all
+
+parser = argparse.ArgumentParser(description="Find trips in the cleaned files (using the lookup index) and warehouse-only months")
+parser.add_argument("--start", help="Pickup time from (inclusive), e.g. 2023-01-15 08:00")
+parser.add_argument("--end", help="Pickup time to (exclusive)")
+parser.add_argument("--pu", type=int, help="PULocationID")
+parser.add_argument("--do", type=int, help="DOLocationID")
+parser.add_argument("--limit", type=int, default=100)
+parser.add_argument(
+    "--warehouse",
+    action=argparse.BooleanOptionalAction,
+    help="Also search months that exist only in the published warehouse snapshot "
+    "(default: on when pipeline.write_cleaned_parquet is false)",
+)
+parser.add_argument("--reindex", action="store_true", help="Rebuild the manifest of every cleaned file and exit")
+args = parser.parse_args()
+
+if args.reindex:
+    reindex_all()
+    raise SystemExit(0)
+
+started = time.perf_counter()
+columns, rows, stats = find_trips(args.start, args.end, args.pu, args.do, args.limit, warehouse=args.warehouse)
+elapsed = time.perf_counter() - started
+
+print("\t".join(columns))
+for row in rows:
+    print("\t".join(str(v) for v in row))
+print(
+    f"\n{len(rows)} trips in {elapsed * 1000:.1f} ms; "
+    f"read {stats.files_scanned}/{stats.files_total} files, "
+    f"{stats.row_groups_scanned}/{stats.row_groups_total} indexed row groups, "
+    f"{stats.tables_scanned} warehouse-only month(s)"
+)
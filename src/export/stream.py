@@ -0,0 +1,151 @@
+import os
+import duckdb
+
+from src.load.snapshots import connect_reader
+
+
+# Output format -> file extension
+FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "jsonl": ".jsonl",
+    "arrow": ".arrow",
+}
+
+# Codecs accepted per format (None = uncompressed)
+COMPRESSIONS = {
+    "csv": {None, "gzip", "zstd"},
+    "jsonl": {None, "gzip", "zstd"},
+    "parquet": {None, "snappy", "zstd", "gzip"},
+    "arrow": {None, "zstd", "lz4"},
+}
+
+DEFAULT_BATCH_ROWS = 100_000
+
+
+class ExportError(Exception):
+    """Raised when an export request cannot be served."""
+
+    pass
+
+
+def infer_format(out_path: str) -> str:
+    """Guess the format from the output path, ignoring a trailing .gz/.zst."""
+    base = out_path
+    for suffix in (".gz", ".zst"):
+        if base.endswith(suffix):
+            base = base[: -len(suffix)]
+    for fmt, ext in FORMATS.items():
+        if base.endswith(ext):
+            return fmt
+    if base.endswith(".ndjson") or base.endswith(".json"):
+        return "jsonl"
+    raise ExportError(f"Cannot infer export format from '{out_path}'; pass fmt explicitly.")
+
+
+def as_query(source: str) -> str:
+    """A table/view/mart name becomes SELECT * FROM it; a query is used as is."""
+    head = source.lstrip().split(None, 1)[0].upper() if source.strip() else ""
+    if head in ("SELECT", "WITH", "FROM", "VALUES", "TABLE"):
+        return source
+    return f"SELECT * FROM {source}"
+
+
+def _copy_options(
+    fmt: str,
+    batch_rows: int,
+    compression: str | None,
+    partition_by: list[str] | None,
+    max_file_size: str | None,
+) -> str:
+    options = []
+    if fmt == "csv":
+        options += ["FORMAT CSV", "HEADER"]
+    elif fmt == "jsonl":
+        options += ["FORMAT JSON"]
+    else:
+        options += ["FORMAT PARQUET", f"ROW_GROUP_SIZE {batch_rows}"]
+
+    if compression:
+        options.append(f"COMPRESSION {compression}")
+    if partition_by:
+        options.append(f"PARTITION_BY ({', '.join(partition_by)})")
+        options.append("OVERWRITE_OR_IGNORE")
+    if max_file_size:
+        options.append(f"FILE_SIZE_BYTES '{max_file_size}'")
+    return ", ".join(options)
+
+
+def _export_arrow(con: duckdb.DuckDBPyConnection, sql: str, out_path: str, batch_rows: int, compression: str | None) -> None:
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ExportError("Arrow IPC export requires pyarrow (pip install pyarrow).") from e
+
+    reader = con.execute(sql).fetch_record_batch(batch_rows)
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(out_path, "wb") as sink, pa.ipc.new_file(sink, reader.schema, options=options) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def export_query(
+    source: str,
+    out_path: str,
+    fmt: str | None = None,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    compression: str | None = None,
+    partition_by: list[str] | None = None,
+    max_file_size: str | None = None,
+    con: duckdb.DuckDBPyConnection | None = None,
+) -> str:
+    """
+    Stream a warehouse table, mart or query to CSV, Parquet, JSON Lines or
+    Arrow IPC without materializing the result in Python.
+
+    CSV/Parquet/JSONL are written by DuckDB's COPY, which streams in
+    vectors; insertion order is only preserved when the query has an
+    ORDER BY, so memory stays bounded. `batch_rows` sets the Parquet row
+    group size / Arrow record batch size. `partition_by` (hive-style
+    directories) or `max_file_size` (e.g. '256MB') turn `out_path` into a
+    directory of files. Arrow IPC needs pyarrow and writes one file.
+
+    Reads from the published warehouse snapshot (read-only) unless `con`
+    is given.
+    Returns `out_path`.
+    """
+    fmt = fmt or infer_format(out_path)
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS[fmt]:
+        allowed = ", ".join(sorted(c for c in COMPRESSIONS[fmt] if c))
+        raise ExportError(f"Compression '{compression}' not supported for {fmt} (use: {allowed})")
+    if fmt == "arrow" and (partition_by or max_file_size):
+        raise ExportError("Arrow IPC export writes a single file; partition_by/max_file_size are not supported.")
+
+    owns_con = con is None
+    if owns_con:
+        con = connect_reader()
+
+    split = bool(partition_by or max_file_size)
+    parent = out_path if split else os.path.dirname(out_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+    sql = as_query(source)
+    # The setting is the caller's when `con` is given: restored below
+    preserve_order = con.execute("SELECT current_setting('preserve_insertion_order');").fetchone()[0]
+    try:
+        con.execute("SET preserve_insertion_order = false;")
+        if fmt == "arrow":
+            _export_arrow(con, sql, out_path, batch_rows, compression)
+        else:
+            options = _copy_options(fmt, batch_rows, compression, partition_by, max_file_size)
+            con.execute(f"COPY ({sql}) TO '{out_path}' ({options});")
+    finally:
+        if owns_con:
+            con.close()
+        else:
+            con.execute(f"SET preserve_insertion_order = {str(preserve_order).lower()};")
+
+    return out_path
@@ -1,11 +1,34 @@
 import os
+from contextlib import nullcontext
+
 import duckdb
 
+from src.load.snapshots import DB_PATH, replace_table
+from src.marts.refresh import refresh_on_load, refreshing_marts
+from src.quality.metrics import create_dq_metrics_view
+
 
 def build_filename(year: int, month: int) -> str:
     return f"yellow_tripdata_{year}-{month:02d}.parquet"
 
 
+def build_table_name(year: int, month: int) -> str:
+    return f"yellow_{year}_{month:02d}"
+
+
+def print_load_summary(con: duckdb.DuckDBPyConnection, db_path: str, table_name: str) -> None:
+    # Basic sanity checks (fast & practical)
+    row_count = con.execute(f"SELECT COUNT(*) FROM {table_name};").fetchone()[0]
+    min_pickup, max_pickup = con.execute(
+        f"SELECT MIN(tpep_pickup_datetime), MAX(tpep_pickup_datetime) FROM {table_name};"
+    ).fetchone()
+
+    print(f"Warehouse DB: {db_path}")
+    print(f"Loaded table: {table_name}")
+    print(f"Rows: {row_count}")
+    print(f"Pickup time range: {min_pickup} -> {max_pickup}")
+
+
 def run_load(year: int, month: int):
     os.makedirs("data/warehouse", exist_ok=True)
 
@@ -17,27 +40,18 @@ def run_load(year: int, month: int):
             f"Cleaned file not found: {cleaned_path}. Run transform first."
         )
 
-    db_path = os.path.join("data/warehouse", "taxi.duckdb")
+    db_path = DB_PATH
     con = duckdb.connect(db_path)
 
     # Create a table for this month (separate table is simplest & explicit)
-    table_name = f"yellow_{year}_{month:02d}"
+    table_name = build_table_name(year, month)
 
-    # Replace table to keep idempotent for the same month
-    con.execute(f"DROP TABLE IF EXISTS {table_name};")
-    con.execute(
-        f"CREATE TABLE {table_name} AS SELECT * FROM '{cleaned_path}';"
-    )
+    # Replace table (atomic swap) to keep idempotent for the same month;
+    # marts that already exist are refreshed for the affected days only
+    with refreshing_marts(con, table_name) if refresh_on_load() else nullcontext():
+        replace_table(con, table_name, f"SELECT * FROM '{cleaned_path}'")
+    create_dq_metrics_view(con)
 
-    # Basic sanity checks (fast & practical)
-    row_count = con.execute(f"SELECT COUNT(*) FROM {table_name};").fetchone()[0]
-    min_pickup, max_pickup = con.execute(
-        f"SELECT MIN(tpep_pickup_datetime), MAX(tpep_pickup_datetime) FROM {table_name};"
-    ).fetchone()
-
-    print(f"Warehouse DB: {db_path}")
-    print(f"Loaded table: {table_name}")
-    print(f"Rows: {row_count}")
-    print(f"Pickup time range: {min_pickup} -> {max_pickup}")
+    print_load_summary(con, db_path, table_name)
 
-    con.close()
\ No newline at end of file
+    con.close()
@@ -0,0 +1,141 @@
+import fcntl
+import os
+import shutil
+from datetime import datetime
+
+import duckdb
+
+from src.config import load_config
+
+
+WAREHOUSE_DIR = os.path.join("data", "warehouse")
+# Working database: loads and mart builds write here
+DB_PATH = os.path.join(WAREHOUSE_DIR, "taxi.duckdb")
+SNAPSHOT_DIR = os.path.join(WAREHOUSE_DIR, "snapshots")
+# Text file holding the file name of the published snapshot
+CURRENT_POINTER = os.path.join(WAREHOUSE_DIR, "CURRENT")
+
+# Prefix for tables being built; it does not match the yellow_% month tables
+STAGING_PREFIX = "_staging_"
+
+
+config = load_config()
+
+
+def snapshot_settings() -> dict:
+    return config.get("warehouse", {}).get("snapshots", {})
+
+
+def publish_every() -> int:
+    """Months a watch or queue worker loads between snapshots (0: only when it runs out of work)."""
+    return snapshot_settings().get("publish_every", 12)
+
+
+def replace_table(con: duckdb.DuckDBPyConnection, table_name: str, select_sql: str) -> None:
+    """
+    Build `table_name` from `select_sql` under a staging name, then swap it
+    in with a drop + rename in one transaction, so the table never goes
+    missing or half-built for other queries.
+    """
+    staging = f"{STAGING_PREFIX}{table_name}"
+    con.execute(f"DROP TABLE IF EXISTS {staging};")
+    con.execute(f"CREATE TABLE {staging} AS {select_sql};")
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute(f"DROP TABLE IF EXISTS {table_name};")
+        con.execute(f"ALTER TABLE {staging} RENAME TO {table_name};")
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+
+
+def current_snapshot_path() -> str | None:
+    """Path of the published snapshot, or None when nothing was published yet."""
+    if not os.path.exists(CURRENT_POINTER):
+        return None
+    with open(CURRENT_POINTER, "r", encoding="utf-8") as f:
+        name = f.read().strip()
+    path = os.path.join(SNAPSHOT_DIR, name)
+    return path if name and os.path.exists(path) else None
+
+
+def publish_snapshot(con: duckdb.DuckDBPyConnection | None = None, keep: int | None = None) -> str:
+    """
+    Publish the working database as a new immutable snapshot.
+
+    The working file is checkpointed (through `con` when the caller holds
+    the only writer connection, otherwise through a short-lived one), copied
+    to data/warehouse/snapshots/, and then made current by atomically
+    replacing the CURRENT pointer. Snapshots beyond the newest `keep` are
+    garbage-collected. Publishers on different workers are serialized by a
+    lock file. Returns the snapshot path.
+
+    Each publish copies the whole working file, so long-running modes
+    batch them (`publish_every`) instead of publishing after every month.
+    """
+    if keep is None:
+        keep = snapshot_settings().get("keep", 3)
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(SNAPSHOT_DIR + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if con is not None:
+            con.execute("CHECKPOINT;")
+        else:
+            writer = duckdb.connect(DB_PATH)
+            writer.execute("CHECKPOINT;")
+            writer.close()
+
+        name = f"taxi_{datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')}.duckdb"
+        path = os.path.join(SNAPSHOT_DIR, name)
+
+        tmp_path = path + ".tmp"
+        shutil.copyfile(DB_PATH, tmp_path)
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        pointer_tmp = CURRENT_POINTER + ".tmp"
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(name + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, CURRENT_POINTER)
+
+    print(f"Published warehouse snapshot: {path}")
+    gc_snapshots(keep)
+    return path
+
+
+def gc_snapshots(keep: int) -> list[str]:
+    """
+    Delete all but the newest `keep` snapshots (never the current one).
+    Readers that still have an old snapshot open keep reading it; the file
+    is only unlinked. Returns the deleted paths.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    current = current_snapshot_path()
+    names = sorted(n for n in os.listdir(SNAPSHOT_DIR) if n.startswith("taxi_") and n.endswith(".duckdb"))
+    deleted = []
+    for name in names[:-keep] if keep > 0 else names:
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if path == current:
+            continue
+        os.remove(path)
+        deleted.append(path)
+    return deleted
+
+
+def connect_reader() -> duckdb.DuckDBPyConnection:
+    """
+    Read-only connection for queries and exports: the current snapshot when
+    one is published (no lock shared with loads), else the working database.
+    """
+    path = current_snapshot_path()
+    if path is None:
+        if not os.path.exists(DB_PATH):
+            raise FileNotFoundError(f"DuckDB warehouse not found: {DB_PATH}")
+        path = DB_PATH
+    return duckdb.connect(path, read_only=True)
@@ -0,0 +1,350 @@
+import glob
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+import duckdb
+
+from src.config import load_config
+from src.load.snapshots import current_snapshot_path
+
+
+config = load_config()
+
+CLEANED_GLOB = os.path.join("data", "cleaned", "yellow_tripdata_*.parquet")
+# One small manifest per cleaned file, so concurrent transforms never share a file
+INDEX_DIR = os.path.join("data", "index")
+
+# Month tables in the warehouse, for months loaded without a cleaned file
+WAREHOUSE_TABLE = re.compile(r"^yellow_(\d{4})_(\d{2})$")
+WAREHOUSE_ALIAS = "_trip_lookup_wh"
+
+TIME_COLUMN = "tpep_pickup_datetime"
+LOCATION_COLUMNS = ["PULocationID", "DOLocationID"]
+
+DEFAULT_ROW_GROUP_SIZE = 122880
+DEFAULT_BLOOM_BITS = 2048
+BLOOM_HASHES = 3
+
+_MASK64 = (1 << 64) - 1
+
+
+@dataclass
+class LookupStats:
+    files_total: int
+    files_scanned: int
+    row_groups_total: int
+    row_groups_scanned: int
+    # Warehouse month tables without a cleaned file; always scanned in full
+    tables_scanned: int = 0
+
+
+def index_settings() -> dict:
+    return config.get("lookup_index", {})
+
+
+def build_index_path(cleaned_path: str) -> str:
+    return os.path.join(INDEX_DIR, os.path.basename(cleaned_path))
+
+
+def _mix64(x: int) -> int:
+    """splitmix64 finalizer: spreads small integer IDs over 64 bits."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _bloom_positions(value: int, bits: int, hashes: int) -> list[int]:
+    h = _mix64(int(value))
+    h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def bloom_filter(values, bits: int = DEFAULT_BLOOM_BITS, hashes: int = BLOOM_HASHES) -> bytes:
+    out = bytearray(bits // 8)
+    for v in values:
+        if v is None:
+            continue
+        for p in _bloom_positions(v, bits, hashes):
+            out[p // 8] |= 1 << (p % 8)
+    return bytes(out)
+
+
+def bloom_may_contain(bloom: bytes, value: int, hashes: int = BLOOM_HASHES) -> bool:
+    bits = len(bloom) * 8
+    return all(bloom[p // 8] & (1 << (p % 8)) for p in _bloom_positions(value, bits, hashes))
+
+
+def write_cleaned_parquet(
+    con: duckdb.DuckDBPyConnection, select_sql: str, cleaned_path: str, presorted: bool = False
+) -> None:
+    """
+    COPY the cleaned rows to `cleaned_path`. With the lookup index enabled,
+    rows are sorted by pickup time (so row groups cover narrow time ranges;
+    skipped when `select_sql` is `presorted`) and the file is indexed right
+    after it is written.
+    """
+    settings = index_settings()
+    if not settings.get("enabled", False):
+        con.execute(f"COPY ({select_sql}) TO '{cleaned_path}' (FORMAT PARQUET);")
+        return
+
+    row_group_size = settings.get("row_group_size", DEFAULT_ROW_GROUP_SIZE)
+    order_by = "" if presorted else f"ORDER BY {TIME_COLUMN}"
+    con.execute(f"""
+        COPY (SELECT * FROM ({select_sql}) {order_by})
+        TO '{cleaned_path}'
+        (FORMAT PARQUET, ROW_GROUP_SIZE {row_group_size});
+    """)
+    index_cleaned_file(cleaned_path, con)
+
+
+def index_cleaned_file(cleaned_path: str, con: duckdb.DuckDBPyConnection | None = None) -> str:
+    """
+    Write the manifest of one cleaned file: per row group its row range,
+    min/max pickup time and location IDs, and a bloom filter per location
+    column. One scan of those three columns. Returns the manifest path.
+    """
+    bits = index_settings().get("bloom_bits", DEFAULT_BLOOM_BITS)
+    owns_con = con is None
+    if owns_con:
+        con = duckdb.connect(database=":memory:")
+    try:
+        loc_aggs = ", ".join(
+            f"MIN({c}), MAX({c}), list(DISTINCT {c})" for c in LOCATION_COLUMNS
+        )
+        rows = con.execute(f"""
+            WITH ranges AS (
+                SELECT
+                    row_group_id,
+                    SUM(row_group_num_rows) OVER (ORDER BY row_group_id) - row_group_num_rows AS row_start,
+                    row_group_num_rows AS num_rows
+                FROM (
+                    SELECT DISTINCT row_group_id, row_group_num_rows
+                    FROM parquet_metadata('{cleaned_path}')
+                )
+            )
+            SELECT r.row_group_id, r.row_start, r.num_rows, MIN(t.{TIME_COLUMN}), MAX(t.{TIME_COLUMN}), {loc_aggs}
+            FROM read_parquet('{cleaned_path}', file_row_number = true) t
+            ASOF JOIN ranges r ON t.file_row_number >= r.row_start
+            GROUP BY ALL
+            ORDER BY 1
+        """).fetchall()
+
+        stat = os.stat(cleaned_path)
+        manifest = []
+        for rg, row_start, num_rows, t_min, t_max, pu_min, pu_max, pu_ids, do_min, do_max, do_ids in rows:
+            manifest.append((
+                os.path.basename(cleaned_path), stat.st_size, stat.st_mtime_ns,
+                rg, row_start, num_rows, t_min, t_max,
+                pu_min, pu_max, bloom_filter(pu_ids, bits),
+                do_min, do_max, bloom_filter(do_ids, bits),
+            ))
+
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        index_path = build_index_path(cleaned_path)
+        tmp_path = index_path + ".tmp"
+        con.execute("""
+            CREATE OR REPLACE TEMP TABLE _trip_index (
+                file VARCHAR, file_size BIGINT, file_mtime_ns BIGINT,
+                row_group BIGINT, row_start BIGINT, num_rows BIGINT,
+                pickup_min TIMESTAMP, pickup_max TIMESTAMP,
+                pu_min BIGINT, pu_max BIGINT, pu_bloom BLOB,
+                do_min BIGINT, do_max BIGINT, do_bloom BLOB
+            );
+        """)
+        con.executemany("INSERT INTO _trip_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", manifest)
+        con.execute(f"COPY _trip_index TO '{tmp_path}' (FORMAT PARQUET);")
+        con.execute("DROP TABLE _trip_index;")
+    finally:
+        if owns_con:
+            con.close()
+
+    os.replace(tmp_path, index_path)
+    print(f"Lookup index written to: {index_path} ({len(manifest)} row groups)")
+    return index_path
+
+
+def reindex_all() -> list[str]:
+    """(Re)build the manifest of every cleaned file."""
+    return [index_cleaned_file(p) for p in sorted(glob.glob(CLEANED_GLOB))]
+
+
+def _load_manifest(con: duckdb.DuckDBPyConnection) -> dict[str, list[tuple]]:
+    """Manifest rows by file name; only entries matching the file on disk (size, mtime) are kept."""
+    paths = sorted(glob.glob(os.path.join(INDEX_DIR, "*.parquet")))
+    if not paths:
+        return {}
+    file_list = ", ".join(f"'{p}'" for p in paths)
+    rows = con.execute(f"""
+        SELECT file, file_size, file_mtime_ns, row_start, num_rows, pickup_min, pickup_max,
+               pu_min, pu_max, pu_bloom, do_min, do_max, do_bloom
+        FROM read_parquet([{file_list}])
+        ORDER BY file, row_start
+    """).fetchall()
+
+    by_file: dict[str, list[tuple]] = {}
+    for row in rows:
+        by_file.setdefault(row[0], []).append(row)
+
+    fresh = {}
+    for name, entries in by_file.items():
+        path = os.path.join(os.path.dirname(CLEANED_GLOB), name)
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        if (entries[0][1], entries[0][2]) == (stat.st_size, stat.st_mtime_ns):
+            fresh[name] = entries
+    return fresh
+
+
+def _warehouse_only_tables(con: duckdb.DuckDBPyConnection, cleaned_names: set[str]) -> list[str]:
+    """
+    Attach the published warehouse snapshot read-only and return its month
+    tables that have no cleaned file. The working database is never
+    attached (a load may hold its lock); without a usable snapshot the
+    lookup carries on over the cleaned files only, with a warning.
+    """
+    path = current_snapshot_path()
+    if path is None:
+        print("Warning: no published warehouse snapshot; months without a cleaned file are not searched")
+        return []
+    try:
+        con.execute(f"ATTACH '{path}' AS {WAREHOUSE_ALIAS} (READ_ONLY);")
+    except duckdb.Error as e:
+        print(f"Warning: could not open warehouse snapshot {path} ({e}); months without a cleaned file are not searched")
+        return []
+    tables = con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE database_name = ? ORDER BY table_name",
+        [WAREHOUSE_ALIAS],
+    ).fetchall()
+    out = []
+    for (name,) in tables:
+        m = WAREHOUSE_TABLE.match(name)
+        if m and f"yellow_tripdata_{m.group(1)}-{m.group(2)}.parquet" not in cleaned_names:
+            out.append(name)
+    return out
+
+
+def _row_group_matches(entry, start, end, pu, do) -> bool:
+    _, _, _, _, _, t_min, t_max, pu_min, pu_max, pu_bloom, do_min, do_max, do_bloom = entry
+    if t_min is None:
+        return False
+    if start is not None and t_max < start:
+        return False
+    if end is not None and t_min >= end:
+        return False
+    for value, lo, hi, bloom in ((pu, pu_min, pu_max, pu_bloom), (do, do_min, do_max, do_bloom)):
+        if value is None:
+            continue
+        if lo is None or not lo <= value <= hi or not bloom_may_contain(bloom, value):
+            return False
+    return True
+
+
+def _merge_ranges(entries) -> list[tuple[int, int]]:
+    """Adjacent row groups as [first_row, last_row] ranges."""
+    ranges = []
+    for e in entries:
+        lo, hi = e[3], e[3] + e[4] - 1
+        if ranges and ranges[-1][1] + 1 == lo:
+            ranges[-1] = (ranges[-1][0], hi)
+        else:
+            ranges.append((lo, hi))
+    return ranges
+
+
+def find_trips(
+    start: datetime | str | None = None,
+    end: datetime | str | None = None,
+    pu: int | None = None,
+    do: int | None = None,
+    limit: int | None = None,
+    con: duckdb.DuckDBPyConnection | None = None,
+    warehouse: bool | None = None,
+) -> tuple[list[str], list[tuple], LookupStats]:
+    """
+    Trips with pickup time in [start, end) and the given pickup/dropoff
+    zones, read from the cleaned Parquet files.
+
+    The manifest prunes whole files and row groups by min/max and bloom
+    filters; only surviving row groups are read (a file_row_number range
+    lets DuckDB skip the others). Cleaned files that are not indexed, or
+    changed since, are scanned in full.
+
+    With `warehouse` (default: when `pipeline.write_cleaned_parquet` is off,
+    the only way a month ends up without a cleaned file), months that exist
+    only as tables in the published snapshot are read from it, unpruned.
+    Returns (columns, rows, stats).
+    """
+    if warehouse is None:
+        warehouse = not config.get("pipeline", {}).get("write_cleaned_parquet", True)
+    if isinstance(start, str):
+        start = datetime.fromisoformat(start)
+    if isinstance(end, str):
+        end = datetime.fromisoformat(end)
+
+    owns_con = con is None
+    if owns_con:
+        con = duckdb.connect(database=":memory:")
+    try:
+        manifest = _load_manifest(con)
+        files = sorted(glob.glob(CLEANED_GLOB))
+        stats = LookupStats(len(files), 0, 0, 0)
+        tables = _warehouse_only_tables(con, {os.path.basename(p) for p in files}) if warehouse else []
+
+        filters, params = [], []
+        if start is not None:
+            filters.append(f"{TIME_COLUMN} >= ?")
+            params.append(start)
+        if end is not None:
+            filters.append(f"{TIME_COLUMN} < ?")
+            params.append(end)
+        for column, value in zip(LOCATION_COLUMNS, (pu, do)):
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        where = " AND ".join(filters) or "TRUE"
+
+        selects, all_params = [], []
+        for path in files:
+            entries = manifest.get(os.path.basename(path))
+            if entries is None:
+                row_filter = "TRUE"
+            else:
+                stats.row_groups_total += len(entries)
+                matching = [e for e in entries if _row_group_matches(e, start, end, pu, do)]
+                if not matching:
+                    continue
+                stats.row_groups_scanned += len(matching)
+                row_filter = " OR ".join(
+                    f"file_row_number BETWEEN {lo} AND {hi}" for lo, hi in _merge_ranges(matching)
+                )
+            stats.files_scanned += 1
+            selects.append(f"""
+                SELECT * EXCLUDE (file_row_number)
+                FROM read_parquet('{path}', file_row_number = true)
+                WHERE ({row_filter}) AND {where}
+            """)
+            all_params += params
+
+        for table in tables:
+            stats.tables_scanned += 1
+            selects.append(f"SELECT * FROM {WAREHOUSE_ALIAS}.{table} WHERE {where}")
+            all_params += params
+
+        if not selects:
+            return [], [], stats
+
+        sql = " UNION ALL BY NAME ".join(selects) + f" ORDER BY {TIME_COLUMN}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        cur = con.execute(sql, all_params)
+        return [d[0] for d in cur.description], cur.fetchall(), stats
+    finally:
+        if not owns_con:
+            con.execute(f"DETACH DATABASE IF EXISTS {WAREHOUSE_ALIAS};")
+        if owns_con:
+            con.close()
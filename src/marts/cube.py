@@ -0,0 +1,293 @@
+import os
+from dataclasses import dataclass
+
+import duckdb
+
+from src.config import load_config
+from src.load.snapshots import DB_PATH, connect_reader, replace_table
+from src.marts.hourly_demand import list_month_tables
+from src.marts.incremental import AFFECTED_DAYS_TABLE, affected_day_filter, table_exists
+
+
+config = load_config()
+
+# Row counts and dimensions of every materialized cuboid; used for routing
+CATALOG_TABLE = "cube_catalog"
+
+DEFAULT_DIMENSIONS = ["pickup_hour", "PULocationID", "DOLocationID", "payment_type", "passenger_count"]
+
+# Dimensions that are not plain trip columns
+DIMENSION_EXPRS = {"pickup_hour": "date_trunc('hour', tpep_pickup_datetime)"}
+
+# Time dimension: cuboids holding it are refreshed for the affected pickup days only
+TIME_DIMENSION = "pickup_hour"
+
+# Additive measures: name -> aggregate over trips. Cuboids roll up with SUM.
+MEASURES = {
+    "trips": "COUNT(*)",
+    "total_revenue": "SUM(total_amount)",
+    "fare_amount": "SUM(fare_amount)",
+    "tip_amount": "SUM(tip_amount)",
+    "trip_distance": "SUM(trip_distance)",
+}
+
+# Source name reported when a query has to scan the monthly trip tables
+TRIP_LEVEL = "trips"
+
+
+class CubeQueryError(Exception):
+    """Raised when a cube query asks for an unknown measure or filter shape."""
+    pass
+
+
+@dataclass(frozen=True)
+class CubeQuery:
+    source: str
+    sql: str
+    params: list
+
+
+def cube_dimensions() -> list[str]:
+    return list(config.get("cube", {}).get("dimensions", DEFAULT_DIMENSIONS))
+
+
+def cube_spec() -> list[tuple[str, ...]]:
+    """
+    Cuboids to materialize, largest first: the base cuboid over all
+    dimensions plus the configured subsets (kept in dimension order).
+    """
+    dims = cube_dimensions()
+    spec = {tuple(dims)}
+    for cuboid in config.get("cube", {}).get("cuboids", []):
+        unknown = set(cuboid) - set(dims)
+        if unknown:
+            raise ValueError(f"Cuboid {cuboid} uses dimensions not in cube.dimensions: {sorted(unknown)}")
+        spec.add(tuple(d for d in dims if d in cuboid))
+    return sorted(spec, key=lambda c: (-len(c), c))
+
+
+def cuboid_table(dims: tuple[str, ...]) -> str:
+    return "cube_" + ("__".join(d.lower() for d in dims) if dims else "all")
+
+
+def _trips_source(con: duckdb.DuckDBPyConnection) -> str:
+    tables = list_month_tables(con)
+    if not tables:
+        raise RuntimeError("No monthly tables found (expected tables like yellow_YYYY_MM).")
+    return "(" + " UNION ALL BY NAME ".join(f"SELECT * FROM {t}" for t in tables) + ")"
+
+
+def _aggregate_select(dims, source: str, from_trips: bool, measures=None, where: str = "TRUE") -> str:
+    """GROUP BY `dims` over trips (measure aggregates) or over a cuboid (SUM roll-up)."""
+    measures = measures or list(MEASURES)
+    if from_trips:
+        dim_sql = [f"{DIMENSION_EXPRS.get(d, d)} AS {d}" for d in dims]
+        measure_sql = [f"{MEASURES[m]} AS {m}" for m in measures]
+    else:
+        dim_sql = list(dims)
+        measure_sql = [f"SUM({m}){'::BIGINT' if m == 'trips' else ''} AS {m}" for m in measures]
+    group_by = f"GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))}" if dims else ""
+    order_by = f"ORDER BY {', '.join(str(i + 1) for i in range(len(dims)))}" if dims else ""
+    return f"""
+        SELECT {', '.join(dim_sql + measure_sql)}
+        FROM {source}
+        WHERE {where}
+        {group_by}
+        {order_by}
+    """
+
+
+def _smallest_superset(dims, catalog: list[tuple[str, tuple[str, ...], int]]) -> str | None:
+    """Smallest cataloged cuboid holding all `dims`, or None."""
+    candidates = [(rows, table) for table, cuboid_dims, rows in catalog if set(dims) <= set(cuboid_dims)]
+    return min(candidates)[1] if candidates else None
+
+
+def _write_catalog(con: duckdb.DuckDBPyConnection, spec) -> None:
+    values = []
+    for dims in spec:
+        table = cuboid_table(dims)
+        rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        dim_list = ", ".join(f"'{d}'" for d in dims)
+        values.append(f"('{table}', [{dim_list}]::VARCHAR[], {rows}::BIGINT)")
+    replace_table(
+        con,
+        CATALOG_TABLE,
+        f"SELECT * FROM (VALUES {', '.join(values)}) t(cuboid, dimensions, row_count)",
+    )
+
+
+def read_catalog(con: duckdb.DuckDBPyConnection) -> list[tuple[str, tuple[str, ...], int]]:
+    """(table, dimensions, row count) of each materialized cuboid; empty when no cube was built."""
+    if not table_exists(con, CATALOG_TABLE):
+        return []
+    rows = con.execute(f"SELECT cuboid, dimensions, row_count FROM {CATALOG_TABLE}").fetchall()
+    return [(table, tuple(dims), n) for table, dims, n in rows]
+
+
+def build_cube(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Full rebuild. The base cuboid is aggregated from the monthly tables in
+    one scan; every smaller cuboid is rolled up from the smallest cuboid
+    already built that contains its dimensions.
+    """
+    spec = cube_spec()
+    trips = _trips_source(con)
+    built = []
+    for dims in spec:
+        parent = _smallest_superset(dims, built)
+        if parent is None:
+            select = _aggregate_select(dims, trips, from_trips=True)
+        else:
+            select = _aggregate_select(dims, parent, from_trips=False)
+        table = cuboid_table(dims)
+        replace_table(con, table, select)
+        built.append((table, dims, con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]))
+    _write_catalog(con, spec)
+
+
+def refresh_cube(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Incremental update after months were (re)loaded. Cuboids with the time
+    dimension only recompute the affected pickup days, from trips (base
+    cuboid) or from their parent cuboid; the others are rolled up again from
+    their (already refreshed) parent. The cube is only maintained once it
+    was built with `--stage cube`; a changed configuration triggers a full
+    rebuild.
+    """
+    catalog = read_catalog(con)
+    if not catalog:
+        return
+    spec = cube_spec()
+    if sorted(dims for _, dims, _ in catalog) != sorted(spec):
+        build_cube(con)
+        return
+
+    where = affected_day_filter(con)
+    if where is None:
+        return
+
+    day_filter = f"date_trunc('day', {TIME_DIMENSION}) IN (SELECT pickup_day FROM {AFFECTED_DAYS_TABLE})"
+    sizes = {table: rows for table, _, rows in catalog}
+    refreshed = []
+    for dims in spec:
+        table = cuboid_table(dims)
+        parent = _smallest_superset(dims, refreshed)
+        if TIME_DIMENSION not in dims:
+            if parent is None:
+                replace_table(con, table, _aggregate_select(dims, _trips_source(con), from_trips=True))
+            else:
+                replace_table(con, table, _aggregate_select(dims, parent, from_trips=False))
+        else:
+            if parent is None:
+                select = _aggregate_select(dims, _trips_source(con), from_trips=True, where=where)
+            else:
+                select = _aggregate_select(dims, parent, from_trips=False, where=day_filter)
+            con.execute("BEGIN TRANSACTION;")
+            try:
+                con.execute(f"DELETE FROM {table} WHERE {day_filter};")
+                con.execute(f"INSERT INTO {table} {select};")
+                con.execute("COMMIT;")
+            except Exception:
+                con.execute("ROLLBACK;")
+                raise
+        refreshed.append((table, dims, sizes[table]))
+    _write_catalog(con, spec)
+
+
+def _filter_sql(column: str, value, params: list) -> str:
+    """
+    One filter: a scalar (equality), a list/set (IN) or a (lo, hi) tuple
+    (half-open range; either end may be None).
+    """
+    if isinstance(value, tuple):
+        if len(value) != 2:
+            raise CubeQueryError(f"Range filter on {column} must be (lo, hi), got {value!r}")
+        parts = []
+        if value[0] is not None:
+            parts.append(f"{column} >= ?")
+            params.append(value[0])
+        if value[1] is not None:
+            parts.append(f"{column} < ?")
+            params.append(value[1])
+        return " AND ".join(parts) or "TRUE"
+    if isinstance(value, (list, set, frozenset)):
+        values = list(value)
+        params.extend(values)
+        return f"{column} IN ({', '.join('?' for _ in values)})" if values else "FALSE"
+    params.append(value)
+    return f"{column} = ?"
+
+
+def plan_cube_query(
+    con: duckdb.DuckDBPyConnection,
+    group_by: list[str],
+    where: dict | None = None,
+    measures: list[str] | None = None,
+) -> CubeQuery:
+    """
+    Route a slice/roll-up query to the smallest cuboid holding every
+    grouped and filtered dimension (row counts from the catalog). Queries
+    touching anything outside the cube fall back to the monthly trip tables,
+    where any trip column can be grouped or filtered on.
+    """
+    where = where or {}
+    measures = measures or list(MEASURES)
+    unknown = [m for m in measures if m not in MEASURES]
+    if unknown:
+        raise CubeQueryError(f"Unknown measure(s): {', '.join(unknown)} (available: {', '.join(MEASURES)})")
+
+    needed = list(group_by) + [c for c in where if c not in group_by]
+    table = _smallest_superset(needed, read_catalog(con))
+    from_trips = table is None
+
+    params: list = []
+    filters = []
+    for column, value in where.items():
+        expr = DIMENSION_EXPRS.get(column, column) if from_trips else column
+        filters.append(_filter_sql(expr, value, params))
+
+    source = _trips_source(con) if from_trips else table
+    sql = _aggregate_select(
+        group_by, source, from_trips=from_trips, measures=measures, where=" AND ".join(filters) or "TRUE"
+    )
+    return CubeQuery(source=TRIP_LEVEL if from_trips else table, sql=sql, params=params)
+
+
+def query_cube(
+    group_by: list[str],
+    where: dict | None = None,
+    measures: list[str] | None = None,
+    con: duckdb.DuckDBPyConnection | None = None,
+) -> tuple[str, list[str], list[tuple]]:
+    """
+    Answer a query through plan_cube_query. Uses a read-only connection to
+    the published snapshot unless `con` is given. Returns (source, column
+    names, rows).
+    """
+    owns_con = con is None
+    if owns_con:
+        con = connect_reader()
+    try:
+        plan = plan_cube_query(con, group_by, where, measures)
+        cur = con.execute(plan.sql, plan.params)
+        columns = [d[0] for d in cur.description]
+        return plan.source, columns, cur.fetchall()
+    finally:
+        if owns_con:
+            con.close()
+
+
+def run_cube():
+    if not os.path.exists(DB_PATH):
+        raise FileNotFoundError(f"Warehouse DB not found: {DB_PATH}")
+
+    con = duckdb.connect(DB_PATH)
+    build_cube(con)
+
+    # quick sanity output
+    print("Built OLAP cube")
+    for table, dims, rows in sorted(read_catalog(con), key=lambda c: c[2]):
+        print(f"  {table}: {rows:,} rows ({', '.join(dims) or 'grand total'})")
+
+    con.close()
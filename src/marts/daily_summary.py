@@ -1,6 +1,9 @@
 import os
 import duckdb
 
+from src.load.snapshots import replace_table
+from src.marts.incremental import AFFECTED_DAYS_TABLE, affected_day_filter, table_exists
+
 
 def list_month_tables(con: duckdb.DuckDBPyConnection):
     rows = con.execute("""
@@ -13,29 +16,15 @@ def list_month_tables(con: duckdb.DuckDBPyConnection):
     return [r[0] for r in rows]
 
 
-def run_mart_daily_summary():
-    db_path = os.path.join("data", "warehouse", "taxi.duckdb")
-    if not os.path.exists(db_path):
-        raise FileNotFoundError(f"Warehouse DB not found: {db_path}")
-
-    os.makedirs("data/marts", exist_ok=True)
-    out_parquet = os.path.join("data", "marts", "mart_daily_summary.parquet")
-
-    con = duckdb.connect(db_path)
-
-    tables = list_month_tables(con)
-    if not tables:
-        raise RuntimeError("No monthly tables found (expected tables like yellow_YYYY_MM).")
-
+def create_all_trips_view(con: duckdb.DuckDBPyConnection, tables: list[str]) -> None:
     # Union all months into a view
     union_sql = " UNION ALL ".join([f"SELECT * FROM {t}" for t in tables])
     con.execute("DROP VIEW IF EXISTS v_all_trips;")
     con.execute(f"CREATE VIEW v_all_trips AS {union_sql};")
 
-    # Build mart table
-    con.execute("DROP TABLE IF EXISTS mart_daily_summary;")
-    con.execute("""
-        CREATE TABLE mart_daily_summary AS
+
+def _mart_select(where: str = "TRUE") -> str:
+    return f"""
         SELECT
             date_trunc('day', tpep_pickup_datetime) AS pickup_day,
             COUNT(*) AS trips,
@@ -44,17 +33,73 @@ def run_mart_daily_summary():
             AVG(fare_amount) AS avg_fare_amount,
             AVG(trip_distance) AS avg_trip_distance
         FROM v_all_trips
+        WHERE {where}
         GROUP BY 1
-        ORDER BY 1;
-    """)
+        ORDER BY 1
+    """
+
+
+def build_mart_daily_summary(con: duckdb.DuckDBPyConnection, tables: list[str]) -> None:
+    """Full rebuild of mart_daily_summary from all monthly tables."""
+    create_all_trips_view(con, tables)
+    replace_table(con, "mart_daily_summary", _mart_select())
 
+
+def refresh_mart_daily_summary(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Incremental update: recompute only the days on the affected pickup
+    days (see src.marts.incremental). Falls back to a full build when the
+    mart does not exist yet.
+    """
+    tables = list_month_tables(con)
+    if not table_exists(con, "mart_daily_summary"):
+        build_mart_daily_summary(con, tables)
+        return
+
+    where = affected_day_filter(con)
+    if where is None:
+        return
+
+    create_all_trips_view(con, tables)
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute(f"""
+            DELETE FROM mart_daily_summary
+            WHERE date_trunc('day', pickup_day) IN (SELECT pickup_day FROM {AFFECTED_DAYS_TABLE});
+        """)
+        con.execute(f"INSERT INTO mart_daily_summary {_mart_select(where)};")
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+
+
+def export_mart_daily_summary(con: duckdb.DuckDBPyConnection, out_parquet: str) -> None:
     # Export mart to parquet
     con.execute(f"""
-        COPY mart_daily_summary
+        COPY (SELECT * FROM mart_daily_summary ORDER BY pickup_day)
         TO '{out_parquet}'
         (FORMAT PARQUET);
     """)
 
+
+def run_mart_daily_summary():
+    db_path = os.path.join("data", "warehouse", "taxi.duckdb")
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Warehouse DB not found: {db_path}")
+
+    os.makedirs("data/marts", exist_ok=True)
+    out_parquet = os.path.join("data", "marts", "mart_daily_summary.parquet")
+
+    con = duckdb.connect(db_path)
+
+    tables = list_month_tables(con)
+    if not tables:
+        raise RuntimeError("No monthly tables found (expected tables like yellow_YYYY_MM).")
+
+    build_mart_daily_summary(con, tables)
+    export_mart_daily_summary(con, out_parquet)
+
     # quick sanity output
     n = con.execute("SELECT COUNT(*) FROM mart_daily_summary;").fetchone()[0]
     min_d, max_d = con.execute("""
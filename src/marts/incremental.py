@@ -0,0 +1,44 @@
+import duckdb
+
+
+# Temp table of pickup days touched by the months loaded since the last refresh
+AFFECTED_DAYS_TABLE = "_affected_days"
+
+
+def capture_affected_days(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
+    """
+    Record the pickup days present in `table_name`. Call it before a month is
+    replaced (days that may disappear) and after (days that may appear).
+    """
+    con.execute(f"CREATE TEMP TABLE IF NOT EXISTS {AFFECTED_DAYS_TABLE} (pickup_day TIMESTAMP);")
+    if table_exists(con, table_name):
+        con.execute(f"""
+            INSERT INTO {AFFECTED_DAYS_TABLE}
+            SELECT DISTINCT date_trunc('day', tpep_pickup_datetime) FROM {table_name};
+        """)
+
+
+def affected_day_filter(con: duckdb.DuckDBPyConnection, ts_column: str = "tpep_pickup_datetime") -> str | None:
+    """
+    WHERE clause selecting trips on the affected days, or None when nothing
+    was captured. The outer range lets DuckDB skip row groups via min/max.
+    """
+    lo, hi = con.execute(f"SELECT MIN(pickup_day), MAX(pickup_day) FROM {AFFECTED_DAYS_TABLE};").fetchone()
+    if lo is None:
+        return None
+    return f"""
+        {ts_column} >= TIMESTAMP '{lo}'
+        AND {ts_column} < TIMESTAMP '{hi}' + INTERVAL 1 DAY
+        AND date_trunc('day', {ts_column}) IN (SELECT pickup_day FROM {AFFECTED_DAYS_TABLE})
+    """
+
+
+def clear_affected_days(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"DROP TABLE IF EXISTS {AFFECTED_DAYS_TABLE};")
+
+
+def table_exists(con: duckdb.DuckDBPyConnection, table_name: str) -> bool:
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?",
+        [table_name],
+    ).fetchone()[0] > 0
@@ -0,0 +1,60 @@
+import os
+from contextlib import contextmanager
+
+import duckdb
+
+from src.config import load_config
+from src.marts.cube import CATALOG_TABLE, refresh_cube
+from src.marts.daily_summary import export_mart_daily_summary, refresh_mart_daily_summary
+from src.marts.hourly_demand import export_mart_hourly_demand, refresh_mart_hourly_demand
+from src.marts.incremental import capture_affected_days, clear_affected_days, table_exists
+from src.marts.rolling_windows import export_mart_rolling_demand, refresh_mart_rolling_demand
+
+
+config = load_config()
+
+# (mart table, incremental refresh, parquet export), in dependency order
+MART_REFRESHERS = [
+    ("mart_hourly_demand", refresh_mart_hourly_demand, export_mart_hourly_demand),
+    ("mart_daily_summary", refresh_mart_daily_summary, export_mart_daily_summary),
+    # Built from mart_daily_summary
+    ("mart_rolling_demand", refresh_mart_rolling_demand, export_mart_rolling_demand),
+]
+
+
+def refresh_marts(con: duckdb.DuckDBPyConnection, build_missing: bool = True) -> None:
+    """
+    Bring the marts up to date with the days captured by
+    capture_affected_days(), re-export them to data/marts/, and reset the
+    captured days. With `build_missing` false, marts that were never built
+    are skipped.
+    """
+    os.makedirs("data/marts", exist_ok=True)
+    for mart, refresh, export in MART_REFRESHERS:
+        if not build_missing and not table_exists(con, mart):
+            continue
+        refresh(con)
+        export(con, os.path.join("data", "marts", f"{mart}.parquet"))
+        print(f"Refreshed {mart}")
+    # The cube is kept up to date once it was built (--stage cube)
+    if table_exists(con, CATALOG_TABLE):
+        refresh_cube(con)
+        print("Refreshed OLAP cube")
+    clear_affected_days(con)
+
+
+@contextmanager
+def refreshing_marts(con: duckdb.DuckDBPyConnection, table_name: str, build_missing: bool = False):
+    """
+    Wrap the (re)load of one monthly table: the pickup days of its old and
+    new contents are captured, and the marts are refreshed incrementally
+    for those days afterwards.
+    """
+    capture_affected_days(con, table_name)
+    yield
+    capture_affected_days(con, table_name)
+    refresh_marts(con, build_missing=build_missing)
+
+
+def refresh_on_load() -> bool:
+    return config.get("marts", {}).get("refresh_on_load", True)
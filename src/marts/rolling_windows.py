@@ -0,0 +1,164 @@
+import os
+import duckdb
+
+from src.config import load_config
+from src.load.snapshots import replace_table
+from src.marts.incremental import AFFECTED_DAYS_TABLE, table_exists
+
+
+config = load_config()
+
+DEFAULT_WINDOWS = [7, 28, 90]
+
+# Relative tolerance when comparing incremental sums with a full recompute
+CHECK_TOLERANCE = 1e-9
+
+
+def configured_windows() -> list[int]:
+    return sorted(set(config.get("marts", {}).get("rolling_windows_days", DEFAULT_WINDOWS)))
+
+
+def _full_select(window_days: int) -> str:
+    """Trailing `window_days`-day sums for every day, via a window function."""
+    frame = f"RANGE BETWEEN INTERVAL {window_days - 1} DAY PRECEDING AND CURRENT ROW"
+    return f"""
+        SELECT
+            {window_days} AS window_days,
+            pickup_day,
+            SUM(trips) OVER (ORDER BY pickup_day {frame}) AS trips,
+            SUM(total_revenue) OVER (ORDER BY pickup_day {frame}) AS total_revenue
+        FROM mart_daily_summary
+    """
+
+
+def _full_recompute_sql(windows: list[int]) -> str:
+    return " UNION ALL ".join(_full_select(n) for n in windows)
+
+
+def build_mart_rolling_demand(con: duckdb.DuckDBPyConnection, windows: list[int] | None = None) -> None:
+    """Full rebuild of mart_rolling_demand from mart_daily_summary."""
+    windows = windows or configured_windows()
+    replace_table(
+        con,
+        "mart_rolling_demand",
+        f"SELECT * FROM ({_full_recompute_sql(windows)}) ORDER BY window_days, pickup_day",
+    )
+
+
+def refresh_mart_rolling_demand(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Incremental update after mart_daily_summary has been refreshed: for each
+    window size N, only days within N-1 days after an affected pickup day
+    are recomputed (as a range join over the daily mart), everything else
+    is left untouched. Rebuilds fully when the mart is missing or the
+    configured window sizes changed.
+    """
+    windows = configured_windows()
+    if not table_exists(con, "mart_rolling_demand"):
+        build_mart_rolling_demand(con, windows)
+        return
+    stored = [r[0] for r in con.execute(
+        "SELECT DISTINCT window_days FROM mart_rolling_demand ORDER BY 1;"
+    ).fetchall()]
+    if stored != windows:
+        build_mart_rolling_demand(con, windows)
+        return
+
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        for n in windows:
+            # Days whose trailing window overlaps an affected day
+            targets = f"""
+                SELECT DISTINCT pickup_day FROM (
+                    SELECT t.pickup_day
+                    FROM mart_daily_summary t
+                    JOIN {AFFECTED_DAYS_TABLE} a
+                      ON t.pickup_day >= a.pickup_day
+                     AND t.pickup_day < a.pickup_day + INTERVAL {n} DAY
+                    UNION ALL
+                    SELECT pickup_day FROM {AFFECTED_DAYS_TABLE}
+                )
+            """
+            con.execute(f"""
+                DELETE FROM mart_rolling_demand
+                WHERE window_days = {n} AND pickup_day IN ({targets});
+            """)
+            con.execute(f"""
+                INSERT INTO mart_rolling_demand
+                SELECT
+                    {n} AS window_days,
+                    t.pickup_day,
+                    SUM(s.trips) AS trips,
+                    SUM(s.total_revenue) AS total_revenue
+                FROM mart_daily_summary t
+                JOIN mart_daily_summary s
+                  ON s.pickup_day > t.pickup_day - INTERVAL {n} DAY
+                 AND s.pickup_day <= t.pickup_day
+                WHERE t.pickup_day IN ({targets})
+                GROUP BY 1, 2;
+            """)
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+
+
+def check_mart_rolling_demand(con: duckdb.DuckDBPyConnection) -> int:
+    """
+    Compare mart_rolling_demand with a full recompute. Returns the number of
+    (window_days, pickup_day) rows that are missing, extra or differ.
+    """
+    return con.execute(f"""
+        SELECT COUNT(*)
+        FROM mart_rolling_demand m
+        FULL OUTER JOIN ({_full_recompute_sql(configured_windows())}) f
+          ON m.window_days = f.window_days AND m.pickup_day = f.pickup_day
+        WHERE m.pickup_day IS NULL
+           OR f.pickup_day IS NULL
+           OR m.trips <> f.trips
+           OR abs(m.total_revenue - f.total_revenue) > {CHECK_TOLERANCE} * greatest(abs(f.total_revenue), 1)
+    """).fetchone()[0]
+
+
+def export_mart_rolling_demand(con: duckdb.DuckDBPyConnection, out_parquet: str) -> None:
+    # Export mart to parquet
+    con.execute(f"""
+        COPY (SELECT * FROM mart_rolling_demand ORDER BY window_days, pickup_day)
+        TO '{out_parquet}'
+        (FORMAT PARQUET);
+    """)
+
+
+def run_mart_rolling_demand(check: bool = False):
+    db_path = os.path.join("data", "warehouse", "taxi.duckdb")
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Warehouse DB not found: {db_path}")
+
+    con = duckdb.connect(db_path)
+
+    if not table_exists(con, "mart_daily_summary"):
+        con.close()
+        raise RuntimeError("mart_daily_summary not found. Run: python main.py --year 2023 --month 1 --stage mart_daily")
+
+    if check:
+        mismatches = check_mart_rolling_demand(con)
+        con.close()
+        print(f"mart_rolling_demand vs full recompute: {mismatches} mismatching rows")
+        if mismatches:
+            raise RuntimeError(f"mart_rolling_demand is out of date ({mismatches} rows differ)")
+        return
+
+    os.makedirs("data/marts", exist_ok=True)
+    out_parquet = os.path.join("data", "marts", "mart_rolling_demand.parquet")
+
+    build_mart_rolling_demand(con)
+    export_mart_rolling_demand(con, out_parquet)
+
+    # quick sanity output
+    n = con.execute("SELECT COUNT(*) FROM mart_rolling_demand;").fetchone()[0]
+    print("Created mart_rolling_demand")
+    print(f"Windows (days): {', '.join(str(w) for w in configured_windows())}")
+    print(f"Rows: {n}")
+    print(f"Exported to: {out_parquet}")
+
+    con.close()
@@ -0,0 +1,108 @@
+import os
+from contextlib import nullcontext
+
+import duckdb
+
+from src.config import load_config
+from src.load.build_warehouse import DB_PATH, build_table_name, print_load_summary
+from src.load.snapshots import replace_table
+from src.lookup.trip_index import write_cleaned_parquet
+from src.marts.refresh import refresh_on_load, refreshing_marts
+from src.quality.metrics import create_dq_metrics_view
+from src.quality.report import generate_dq_report
+from src.transform.clean import (
+    build_filename,
+    dedup_config,
+    drop_cleaning_state,
+    prepare_clean_rows,
+    validate_raw_schema,
+    write_cleaning_report,
+)
+from src.transform.dedup import configure_spill
+
+
+config = load_config()
+
+
+def run_transform_load(
+    year: int,
+    month: int,
+    write_cleaned: bool | None = None,
+    con: duckdb.DuckDBPyConnection | None = None,
+    refresh_marts: bool | None = None,
+):
+    """
+    Fused transform + load: clean the raw month straight into its warehouse table.
+
+    The cleaned rows stay inside DuckDB's vectorized pipeline on their way into
+    the warehouse, so there is no Parquet encode/write/read/decode between the
+    two stages. Writing the cleaned Parquet is optional (config
+    `pipeline.write_cleaned_parquet`); when enabled it is exported from the
+    loaded table instead of being re-read by the load.
+
+    Marts that already exist are refreshed for the month's pickup days
+    (`refresh_marts`, default config `marts.refresh_on_load`).
+
+    Pass an open warehouse connection as `con` to reuse it (watch mode);
+    it is left open.
+    """
+    if write_cleaned is None:
+        write_cleaned = config.get("pipeline", {}).get("write_cleaned_parquet", True)
+    if refresh_marts is None:
+        refresh_marts = refresh_on_load()
+
+    filename = build_filename(year, month)
+    raw_path = os.path.join("data/raw", filename)
+    cleaned_path = os.path.join("data/cleaned", filename)
+
+    if not os.path.exists(raw_path):
+        raise FileNotFoundError(f"Raw file not found: {raw_path}")
+
+    print(f"Transforming and loading {filename}...")
+
+    os.makedirs("data/cleaned", exist_ok=True)
+    os.makedirs("data/warehouse", exist_ok=True)
+
+    db_path = DB_PATH
+    owns_con = con is None
+    if owns_con:
+        con = duckdb.connect(db_path)
+        configure_spill(con, dedup_config)
+    try:
+        validate_raw_schema(con, raw_path, year, month)
+
+        clean_sql, result = prepare_clean_rows(con, raw_path, year, month)
+        print(f"Raw rows: {result.raw_count}")
+
+        table_name = build_table_name(year, month)
+        with refreshing_marts(con, table_name) if refresh_marts else nullcontext():
+            replace_table(con, table_name, clean_sql)
+            drop_cleaning_state(con)
+
+        write_cleaning_report(year, month, result)
+
+        if write_cleaned:
+            write_cleaned_parquet(con, f"SELECT * FROM {table_name}", cleaned_path)
+            print(f"Cleaned Parquet written to: {cleaned_path}")
+
+        dq_path = generate_dq_report(
+            year,
+            month,
+            raw_path,
+            None,
+            config,
+            con=con,
+            cleaned_table=table_name,
+            rule_counts=result.rule_counts,
+            duplicates=result.duplicates,
+        )
+        print(f"DQ report written to: {dq_path}")
+        create_dq_metrics_view(con)
+
+        print_load_summary(con, db_path, table_name)
+    finally:
+        drop_cleaning_state(con)
+        if owns_con:
+            con.close()
+
+    print(f"Transform + load completed for {filename}")
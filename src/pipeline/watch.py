@@ -0,0 +1,238 @@
+import json
+import os
+import queue
+import re
+import signal
+import threading
+from dataclasses import dataclass, field
+
+import duckdb
+
+from src.config import load_config
+from src.load.build_warehouse import DB_PATH, build_table_name
+from src.load.snapshots import publish_every, publish_snapshot, snapshot_settings
+from src.marts.refresh import refreshing_marts
+from src.pipeline.stage_registry import StageRegistry
+from src.pipeline.transform_load import run_transform_load
+from src.transform.clean import dedup_config
+from src.transform.dedup import configure_spill
+
+
+RAW_FILE_PATTERN = re.compile(r"^yellow_tripdata_(\d{4})-(\d{2})\.parquet$")
+
+# Raw file signatures of the months watch has loaded, kept across restarts
+SEEN_PATH = os.path.join("data", "registry", "watch_seen.json")
+
+# Queue sentinel telling the worker to exit
+_STOP = None
+
+
+@dataclass
+class RawDirPoller:
+    """
+    Polls the raw directory and reports monthly files that are new or changed.
+
+    A file is reported once its (size, mtime) signature has been identical on
+    two consecutive polls, so files still being downloaded are not picked up.
+    """
+
+    raw_dir: str
+    # file name -> signature already handed out
+    seen: dict[str, tuple[int, int]] = field(default_factory=dict)
+    # file name -> signature observed on the previous poll, not yet stable
+    pending: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+    def _scan(self):
+        if not os.path.isdir(self.raw_dir):
+            return
+        with os.scandir(self.raw_dir) as it:
+            for entry in it:
+                match = RAW_FILE_PATTERN.match(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                st = entry.stat()
+                yield entry.name, int(match.group(1)), int(match.group(2)), (st.st_size, st.st_mtime_ns)
+
+    def prime(self, signatures: dict[str, tuple[int, int]], is_loaded=None) -> None:
+        """
+        Start from the signatures recorded when files were last processed, so
+        files replaced since then are reported. Files without a record whose
+        month `is_loaded(year, month)` (loaded outside watch) count as seen
+        as they are now.
+        """
+        for name, year, month, sig in self._scan():
+            if name in signatures:
+                self.seen[name] = tuple(signatures[name])
+            elif is_loaded is not None and is_loaded(year, month):
+                self.seen[name] = sig
+
+    def poll(self) -> list[tuple[str, int, int]]:
+        """Return (file name, year, month) for files that are ready to process."""
+        ready = []
+        for name, year, month, sig in self._scan():
+            if self.seen.get(name) == sig:
+                continue
+            if self.pending.get(name) == sig:
+                ready.append((name, year, month))
+            else:
+                self.pending[name] = sig
+        return ready
+
+    def mark_seen(self, name: str) -> None:
+        """Record the file's current signature so it is not reported again until it changes."""
+        sig = self.pending.pop(name, None)
+        if sig is not None:
+            self.seen[name] = sig
+
+
+@dataclass
+class SeenFiles:
+    """JSON file of file name -> (size, mtime_ns) for raw files that were loaded."""
+
+    path: str
+
+    def load(self) -> dict[str, tuple[int, int]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {name: tuple(sig) for name, sig in json.load(f).items()}
+
+    def record(self, name: str, sig: tuple[int, int]) -> None:
+        seen = self.load()
+        seen[name] = list(sig)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(seen, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _process_month(con: duckdb.DuckDBPyConnection, registry: StageRegistry, year: int, month: int) -> bool:
+    month_key = f"{year}-{month:02d}"
+    table_name = build_table_name(year, month)
+    print(f"\n=== Watch: processing {month_key} ===")
+    try:
+        # Days of the old and the new version of the month both get their marts refreshed
+        with refreshing_marts(con, table_name, build_missing=True):
+            run_transform_load(year, month, con=con, refresh_marts=False)
+    except Exception as e:
+        registry.mark_failed(month_key, "transform")
+        registry.mark_failed(month_key, "load")
+        print(f"!!! Watch: failed {month_key}: {e}")
+        return False
+
+    registry.mark_done(month_key, "extract")
+    registry.mark_done(month_key, "transform")
+    registry.mark_done(month_key, "load")
+    print(f"Marked done: {month_key} transform_load")
+    return True
+
+
+def _publish(con: duckdb.DuckDBPyConnection) -> None:
+    try:
+        publish_snapshot(con=con)
+    except Exception as e:
+        print(f"!!! Watch: publishing a snapshot failed: {e}")
+
+
+def _worker(work: queue.Queue, registry: StageRegistry, seen_files: SeenFiles) -> None:
+    # The warehouse connection (and its caches) live as long as the worker
+    os.makedirs("data/warehouse", exist_ok=True)
+    con = duckdb.connect(DB_PATH)
+    configure_spill(con, dedup_config)
+    publish = snapshot_settings().get("enabled", True)
+    every = publish_every()
+    # Months loaded since the last snapshot: one is published when the queue
+    # runs empty, and during a long backlog every `every` months
+    unpublished = 0
+    try:
+        while True:
+            item = work.get()
+            if item is _STOP:
+                break
+            name, year, month, sig = item
+            # The signature taken when the file was queued: a newer version is picked up again
+            if _process_month(con, registry, year, month):
+                seen_files.record(name, sig)
+                unpublished += 1
+            if publish and unpublished and (work.empty() or (every and unpublished >= every)):
+                _publish(con)
+                unpublished = 0
+        if publish and unpublished:
+            _publish(con)
+    finally:
+        con.close()
+
+
+def run_watch(
+    poll_interval: float | None = None,
+    queue_size: int | None = None,
+    raw_dir: str = "data/raw",
+    registry_path: str = "data/registry/stage_status.json",
+    seen_path: str = SEEN_PATH,
+):
+    """
+    Keep running and push new or changed raw months through transform, load
+    and an incremental mart refresh.
+
+    A single worker thread owns one warehouse connection for the life of the
+    process. The work queue is bounded: when it is full, ready files stay
+    pending and are offered again on the next poll. SIGINT/SIGTERM stop the
+    poller; the month in progress finishes and is recorded in the stage
+    registry, queued months are left for the next start.
+
+    The signature of each file loaded is recorded in `seen_path`; on start,
+    files whose signature differs from the record (replaced while watch was
+    stopped, or queued but never run) are processed again.
+    """
+    watch_cfg = load_config().get("watch", {})
+    if poll_interval is None:
+        poll_interval = watch_cfg.get("poll_interval_seconds", 5)
+    if queue_size is None:
+        queue_size = watch_cfg.get("queue_size", 4)
+
+    registry = StageRegistry(registry_path)
+    seen_files = SeenFiles(seen_path)
+    poller = RawDirPoller(raw_dir)
+
+    # Months already loaded are only re-processed if their file changed since
+    done = registry.load()
+    poller.prime(seen_files.load(), lambda y, m: done.get(f"{y}-{m:02d}", {}).get("load") == "done")
+
+    stop = threading.Event()
+
+    def _request_stop(signum, frame):
+        print(f"\nWatch: received signal {signum}, finishing current month...")
+        stop.set()
+
+    previous_handlers = {
+        sig: signal.signal(sig, _request_stop) for sig in (signal.SIGINT, signal.SIGTERM)
+    }
+
+    work: queue.Queue = queue.Queue(maxsize=queue_size)
+    worker = threading.Thread(target=_worker, args=(work, registry, seen_files), name="watch-worker")
+    worker.start()
+
+    print(f"Watching {raw_dir} (poll every {poll_interval}s, queue size {queue_size}). Ctrl-C to stop.")
+    try:
+        while not stop.is_set():
+            for name, year, month in poller.poll():
+                try:
+                    work.put_nowait((name, year, month, poller.pending[name]))
+                except queue.Full:
+                    break
+                poller.mark_seen(name)
+            stop.wait(poll_interval)
+    finally:
+        # Drop months that have not started, then let the worker finish and exit
+        while True:
+            try:
+                work.get_nowait()
+            except queue.Empty:
+                break
+        work.put(_STOP)
+        worker.join()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+    print("Watch stopped.")
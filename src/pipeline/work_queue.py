@@ -0,0 +1,371 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from src.config import load_config
+
+
+# Stage order within a month; a task is claimable once all earlier stages are done
+STAGE_SEQ = {"extract": 0, "transform": 1, "load": 2}
+
+# Stages that write the warehouse: at most one of them runs at a time, across all workers
+WRITER_STAGES = ("load",)
+
+# Stages that read and write the dedup key files of neighbouring months: two
+# of them never run at once for months within the dedup lookback
+NEIGHBOUR_STAGES = ("transform",)
+
+
+@dataclass(frozen=True)
+class Task:
+    month: str
+    stage: str
+    attempt: int
+
+
+def month_index(month_key: str) -> int:
+    year, month = month_key.split("-")
+    return int(year) * 12 + int(month) - 1
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class WorkQueue:
+    """
+    (month, stage) task queue in a SQLite file on a filesystem shared by all
+    workers.
+
+    Workers claim tasks under a lease that they extend with heartbeats;
+    a task whose lease expired (worker died or hung) is handed out again,
+    up to `max_attempts` times. Claims run in an IMMEDIATE transaction, so
+    the database lock serializes them. SQLite's default rollback journal is
+    used, because WAL mode needs shared memory that network filesystems do
+    not provide.
+
+    `neighbour_lookback` keeps transforms of months that close apart from
+    running at the same time, so cross-month dedup always sees the key file
+    of whichever neighbour finished first.
+    """
+
+    path: str
+    lease_seconds: float = 120.0
+    max_attempts: int = 3
+    neighbour_lookback: int = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        con.execute("PRAGMA busy_timeout = 60000;")
+        return con
+
+    def init(self) -> None:
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        con = self._connect()
+        try:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    month TEXT NOT NULL,
+                    month_index INTEGER NOT NULL,
+                    stage TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (month, stage)
+                );
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, month, seq);")
+        finally:
+            con.close()
+
+    def enqueue(self, months: list[str], stages: list[str]) -> int:
+        """
+        Add (month, stage) tasks. Tasks that already exist keep their state,
+        except failed ones, which are reset to pending. Returns how many tasks
+        were added or reset.
+        """
+        for st in stages:
+            if st not in STAGE_SEQ:
+                raise ValueError(f"Stage '{st}' cannot be queued (use one of: {', '.join(STAGE_SEQ)})")
+
+        self.init()
+        con = self._connect()
+        now = time.time()
+        changed = 0
+        try:
+            con.execute("BEGIN IMMEDIATE;")
+            for month in months:
+                for st in stages:
+                    cur = con.execute(
+                        """
+                        INSERT INTO tasks (month, month_index, stage, seq, status, attempts, updated_at)
+                        VALUES (?, ?, ?, ?, 'pending', 0, ?)
+                        ON CONFLICT (month, stage) DO UPDATE
+                            SET status = 'pending', attempts = 0, error = NULL, worker = NULL,
+                                lease_expires = NULL, updated_at = excluded.updated_at
+                            WHERE tasks.status = 'failed'
+                        """,
+                        (month, month_index(month), st, STAGE_SEQ[st], now),
+                    )
+                    changed += cur.rowcount
+            con.execute("COMMIT;")
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+        finally:
+            con.close()
+        return changed
+
+    def claim(self, worker_id: str) -> Optional[Task]:
+        """
+        Lease the next runnable task to `worker_id`, or return None.
+
+        Runnable: pending (or running with an expired lease), every earlier
+        stage of the same month done, for writer stages no other writer stage
+        currently leased, and for neighbour stages none leased for a month
+        within `neighbour_lookback`.
+        """
+        con = self._connect()
+        now = time.time()
+        writers = ", ".join(f"'{s}'" for s in WRITER_STAGES)
+        neighbours = ", ".join(f"'{s}'" for s in NEIGHBOUR_STAGES)
+        try:
+            con.execute("BEGIN IMMEDIATE;")
+
+            # Expired leases that used up their attempts are given up on
+            con.execute(
+                """
+                UPDATE tasks SET status = 'failed', error = 'lease expired', worker = NULL, updated_at = ?
+                WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+                """,
+                (now, now, self.max_attempts),
+            )
+
+            _block_dependents(con, now)
+
+            row = con.execute(
+                f"""
+                SELECT month, stage, attempts FROM tasks t
+                WHERE (t.status = 'pending' OR (t.status = 'running' AND t.lease_expires < :now))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM tasks p
+                      WHERE p.month = t.month AND p.seq < t.seq AND p.status <> 'done'
+                  )
+                  AND (
+                      t.stage NOT IN ({writers})
+                      OR NOT EXISTS (
+                          SELECT 1 FROM tasks w
+                          WHERE w.stage IN ({writers}) AND w.status = 'running' AND w.lease_expires >= :now
+                      )
+                  )
+                  AND (
+                      t.stage NOT IN ({neighbours})
+                      OR NOT EXISTS (
+                          SELECT 1 FROM tasks n
+                          WHERE n.stage IN ({neighbours}) AND n.status = 'running' AND n.lease_expires >= :now
+                            AND n.month <> t.month
+                            AND abs(n.month_index - t.month_index) <= :lookback
+                      )
+                  )
+                ORDER BY t.month, t.seq
+                LIMIT 1
+                """,
+                {"now": now, "lookback": self.neighbour_lookback},
+            ).fetchone()
+
+            if row is None:
+                con.execute("COMMIT;")
+                return None
+
+            month, stage, attempts = row
+            con.execute(
+                """
+                UPDATE tasks
+                SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?
+                WHERE month = ? AND stage = ?
+                """,
+                (worker_id, now + self.lease_seconds, now, month, stage),
+            )
+            con.execute("COMMIT;")
+            return Task(month, stage, attempts + 1)
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+        finally:
+            con.close()
+
+    def _update_owned(self, task: Task, worker_id: str, sql: str, params: tuple) -> bool:
+        con = self._connect()
+        try:
+            cur = con.execute(
+                f"{sql} WHERE month = ? AND stage = ? AND worker = ? AND status = 'running'",
+                params + (task.month, task.stage, worker_id),
+            )
+            return cur.rowcount == 1
+        finally:
+            con.close()
+
+    def heartbeat(self, task: Task, worker_id: str) -> bool:
+        """Extend the lease. False means the lease was lost to another worker."""
+        now = time.time()
+        return self._update_owned(
+            task, worker_id, "UPDATE tasks SET lease_expires = ?, updated_at = ?", (now + self.lease_seconds, now)
+        )
+
+    def complete(self, task: Task, worker_id: str) -> bool:
+        return self._update_owned(
+            task,
+            worker_id,
+            "UPDATE tasks SET status = 'done', lease_expires = NULL, error = NULL, updated_at = ?",
+            (time.time(),),
+        )
+
+    def fail(self, task: Task, worker_id: str, error: str) -> bool:
+        """
+        Record a failure; the task goes back to pending until it runs out of
+        attempts. Once it has failed for good, the later stages of its month
+        can never run, so they are failed too.
+        """
+        status = "failed" if task.attempt >= self.max_attempts else "pending"
+        now = time.time()
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE;")
+            cur = con.execute(
+                """
+                UPDATE tasks SET status = ?, worker = NULL, lease_expires = NULL, error = ?, updated_at = ?
+                WHERE month = ? AND stage = ? AND worker = ? AND status = 'running'
+                """,
+                (status, error[:2000], now, task.month, task.stage, worker_id),
+            )
+            _block_dependents(con, now)
+            con.execute("COMMIT;")
+            return cur.rowcount == 1
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+        finally:
+            con.close()
+
+    def counts(self) -> dict[str, int]:
+        """Number of tasks per status."""
+        if not os.path.exists(self.path):
+            return {}
+        con = self._connect()
+        try:
+            rows = con.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        finally:
+            con.close()
+        return {status: n for status, n in rows}
+
+
+def _block_dependents(con: sqlite3.Connection, now: float) -> None:
+    """Fail pending tasks whose month has an earlier stage that failed for good."""
+    con.execute(
+        """
+        UPDATE tasks SET status = 'failed', updated_at = ?, error = 'blocked by ' || (
+            SELECT p.stage FROM tasks p
+            WHERE p.month = tasks.month AND p.seq < tasks.seq AND p.status = 'failed'
+            ORDER BY p.seq LIMIT 1
+        )
+        WHERE status = 'pending' AND EXISTS (
+            SELECT 1 FROM tasks p
+            WHERE p.month = tasks.month AND p.seq < tasks.seq AND p.status = 'failed'
+        )
+        """,
+        (now,),
+    )
+
+
+def open_queue(path: str | None = None) -> WorkQueue:
+    """WorkQueue configured from the `queue` config section (and the dedup lookback)."""
+    cfg = load_config()
+    queue_cfg = cfg.get("queue", {})
+    dedup_cfg = cfg.get("dedup", {})
+    lookback = dedup_cfg.get("cross_month_lookback", 1) if dedup_cfg.get("enabled", False) else 0
+    return WorkQueue(
+        path=path or queue_cfg.get("path", "data/registry/work_queue.sqlite"),
+        lease_seconds=queue_cfg.get("lease_seconds", 120),
+        max_attempts=queue_cfg.get("max_attempts", 3),
+        neighbour_lookback=lookback,
+    )
+
+
+class _Heartbeat:
+    """Extends a task's lease from a background thread while the stage runs."""
+
+    def __init__(self, queue: WorkQueue, task: Task, worker_id: str):
+        self._queue = queue
+        self._task = task
+        self._worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.lost = False
+
+    def _run(self) -> None:
+        interval = max(self._queue.lease_seconds / 3, 0.05)
+        while not self._stop.wait(interval):
+            if not self._queue.heartbeat(self._task, self._worker_id):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(
+    queue: WorkQueue,
+    runner: Callable[[str, str], None],
+    worker_id: str | None = None,
+    poll_interval: float = 2.0,
+) -> dict[str, int]:
+    """
+    Claim and run tasks until none are pending or running anywhere.
+
+    `runner(month_key, stage)` executes one stage. While it runs, a
+    heartbeat keeps the lease alive. When tasks exist but none is runnable
+    yet (earlier stages are running elsewhere, or the warehouse writer is
+    busy), the worker waits `poll_interval` seconds. Returns the final
+    status counts.
+    """
+    worker_id = worker_id or default_worker_id()
+    queue.init()
+
+    while True:
+        task = queue.claim(worker_id)
+        if task is None:
+            counts = queue.counts()
+            if not counts.get("pending") and not counts.get("running"):
+                return counts
+            time.sleep(poll_interval)
+            continue
+
+        print(f"[{worker_id}] --> {task.month} {task.stage} (attempt {task.attempt})")
+        try:
+            with _Heartbeat(queue, task, worker_id) as hb:
+                runner(task.month, task.stage)
+        except Exception as e:
+            queue.fail(task, worker_id, f"{type(e).__name__}: {e}")
+            print(f"[{worker_id}] !!! {task.month} {task.stage} failed: {e}")
+            continue
+
+        if hb.lost or not queue.complete(task, worker_id):
+            print(f"[{worker_id}] lease lost for {task.month} {task.stage}; result left to the new owner")
+        else:
+            print(f"[{worker_id}] done {task.month} {task.stage}")
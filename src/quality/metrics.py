@@ -0,0 +1,158 @@
+import fcntl
+import os
+import duckdb
+
+
+# One compact file for the whole history, sorted for trend lookups
+DQ_METRICS_PATH = os.path.join("data", "quality", "dq_metrics.parquet")
+
+# Columns whose null counts are tracked per layer
+KEY_COLUMNS = [
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+    "passenger_count",
+    "trip_distance",
+    "fare_amount",
+    "total_amount",
+    "PULocationID",
+    "DOLocationID",
+]
+
+# Columns whose min/max are tracked per layer
+RANGE_COLUMNS = ["trip_distance", "fare_amount"]
+
+# Column name used for table-level metrics (row counts, duplicates, ...)
+TABLE_LEVEL = "*"
+
+# (month, layer, column_name, metric, value)
+MetricRow = tuple[str, str, str, str, float]
+
+SCHEMA_SQL = """
+    month VARCHAR,
+    layer VARCHAR,
+    column_name VARCHAR,
+    metric VARCHAR,
+    value DOUBLE
+"""
+
+
+def profile_aggregates(con: duckdb.DuckDBPyConnection, source: str) -> tuple:
+    """
+    Row count, null counts of KEY_COLUMNS and min/max of RANGE_COLUMNS over
+    `source`, as one aggregate row. Rows of disjoint slices combine with
+    merge_profile_aggregates().
+    """
+    exprs = ["COUNT(*)"]
+    exprs += [f"COUNT(*) - COUNT({c})" for c in KEY_COLUMNS]
+    for c in RANGE_COLUMNS:
+        exprs += [f"MIN({c})::DOUBLE", f"MAX({c})::DOUBLE"]
+    return con.execute(f"SELECT {', '.join(exprs)} FROM {source}").fetchone()
+
+
+def merge_profile_aggregates(parts: list[tuple]) -> tuple:
+    """Combine profile_aggregates() rows: counts add up, min/max take the extremes."""
+    n_counts = 1 + len(KEY_COLUMNS)
+    merged = [sum(p[i] for p in parts) for i in range(n_counts)]
+    for i in range(len(RANGE_COLUMNS)):
+        lo = [p[n_counts + 2 * i] for p in parts if p[n_counts + 2 * i] is not None]
+        hi = [p[n_counts + 2 * i + 1] for p in parts if p[n_counts + 2 * i + 1] is not None]
+        merged += [min(lo) if lo else None, max(hi) if hi else None]
+    return tuple(merged)
+
+
+def profile_rows(row: tuple, month_key: str, layer: str) -> list[MetricRow]:
+    """Metric rows of one layer from its profile_aggregates() row."""
+    total = row[0]
+    rows: list[MetricRow] = [(month_key, layer, TABLE_LEVEL, "rows", float(total))]
+    for c, nulls in zip(KEY_COLUMNS, row[1:1 + len(KEY_COLUMNS)]):
+        rows.append((month_key, layer, c, "nulls", float(nulls)))
+        rows.append((month_key, layer, c, "null_rate", (nulls / total) if total else 0.0))
+
+    range_values = row[1 + len(KEY_COLUMNS):]
+    for i, c in enumerate(RANGE_COLUMNS):
+        rows.append((month_key, layer, c, "min", range_values[2 * i]))
+        rows.append((month_key, layer, c, "max", range_values[2 * i + 1]))
+    return rows
+
+
+def profile_layer(con: duckdb.DuckDBPyConnection, source: str, month_key: str, layer: str) -> list[MetricRow]:
+    """
+    Row count, null counts/rates of KEY_COLUMNS and min/max of RANGE_COLUMNS
+    for one dataset layer, computed in a single aggregate over `source`.
+    """
+    return profile_rows(profile_aggregates(con, source), month_key, layer)
+
+
+def metric_value(rows: list[MetricRow], layer: str, column_name: str, metric: str):
+    """Look up one value in a month's metric rows (None when absent)."""
+    for _, lyr, col, met, value in rows:
+        if (lyr, col, met) == (layer, column_name, metric):
+            return value
+    return None
+
+
+def write_dq_metrics(rows: list[MetricRow], month_key: str, path: str = DQ_METRICS_PATH) -> str:
+    """
+    Replace `month_key`'s rows in the metrics file with `rows`. The file is
+    rewritten sorted by (metric, column_name, layer, month) so trend queries
+    over one metric read a narrow slice; the swap is atomic. An exclusive
+    lock on `<path>.lock` serializes writers running in other processes.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        con = duckdb.connect(database=":memory:")
+        try:
+            con.execute(f"CREATE TABLE dq_metrics ({SCHEMA_SQL});")
+            if os.path.exists(path):
+                con.execute(f"INSERT INTO dq_metrics SELECT * FROM '{path}' WHERE month <> ?;", [month_key])
+            con.executemany("INSERT INTO dq_metrics VALUES (?, ?, ?, ?, ?);", rows)
+            con.execute(f"""
+                COPY (SELECT * FROM dq_metrics ORDER BY metric, column_name, layer, month)
+                TO '{tmp_path}'
+                (FORMAT PARQUET);
+            """)
+        finally:
+            con.close()
+
+        os.replace(tmp_path, path)
+    return path
+
+
+def create_dq_metrics_view(con: duckdb.DuckDBPyConnection, path: str = DQ_METRICS_PATH) -> bool:
+    """
+    Expose the metrics file as `dq_metrics` on a (warehouse) connection.
+    The view stores the file's absolute path, so snapshots opened from any
+    working directory on this machine can read it. Skipped (False) while
+    no metrics were written yet.
+    """
+    if not os.path.exists(path):
+        return False
+    con.execute(f"CREATE OR REPLACE VIEW dq_metrics AS SELECT * FROM '{os.path.abspath(path)}';")
+    return True
+
+
+def dq_trend(
+    metric: str,
+    column_name: str = TABLE_LEVEL,
+    layer: str = "cleaned",
+    path: str = DQ_METRICS_PATH,
+) -> list[tuple[str, float]]:
+    """(month, value) for one metric across the full history, oldest first."""
+    if not os.path.exists(path):
+        return []
+    con = duckdb.connect(database=":memory:")
+    try:
+        return con.execute(
+            f"""
+            SELECT month, value
+            FROM '{path}'
+            WHERE metric = ? AND column_name = ? AND layer = ?
+            ORDER BY month
+            """,
+            [metric, column_name, layer],
+        ).fetchall()
+    finally:
+        con.close()
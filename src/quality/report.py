@@ -2,147 +2,177 @@ import os
 from datetime import datetime
 import duckdb
 
+from src.quality.metrics import (
+    KEY_COLUMNS,
+    TABLE_LEVEL,
+    MetricRow,
+    metric_value,
+    profile_layer,
+    profile_rows,
+    write_dq_metrics,
+)
+from src.transform.dedup import DedupResult
+from src.transform.rules import CleaningRule, load_rules, rule_counts_query
+
+
+def _rule_counts(con: duckdb.DuckDBPyConnection, source: str, rules: list[CleaningRule]) -> dict:
+    row = con.execute(rule_counts_query(rules, source)).fetchone()
+    return {r.name: n for r, n in zip(rules, row[2:])}
+
+
+def build_dq_metric_rows(
+    con: duckdb.DuckDBPyConnection,
+    month_key: str,
+    raw_source: str,
+    cleaned_source: str,
+    rules: list[CleaningRule],
+    rule_counts: dict[str, int],
+    duplicates: DedupResult | None = None,
+    raw_profile: tuple | None = None,
+    cleaned_profile: tuple | None = None,
+) -> list[MetricRow]:
+    """
+    All DQ metrics of one month as (month, layer, column_name, metric, value)
+    rows. Layers: `raw`, `cleaned`, `rules` (column = rule name) and `dedup`.
+    `raw_profile` / `cleaned_profile` are a layer's profile_aggregates() row
+    when already known (parallel transform); that source is not scanned then.
+    """
+    if raw_profile is None:
+        rows = profile_layer(con, raw_source, month_key, "raw")
+    else:
+        rows = profile_rows(raw_profile, month_key, "raw")
+    if cleaned_profile is None:
+        rows += profile_layer(con, cleaned_source, month_key, "cleaned")
+    else:
+        rows += profile_rows(cleaned_profile, month_key, "cleaned")
 
-def _count(con: duckdb.DuckDBPyConnection, parquet_path: str) -> int:
-    return con.execute(f"SELECT COUNT(*) FROM '{parquet_path}'").fetchone()[0]
-
-
-def _null_stats(con: duckdb.DuckDBPyConnection, parquet_path: str, cols: list[str]) -> list[tuple[str, int, float]]:
-    total = _count(con, parquet_path)
-    results: list[tuple[str, int, float]] = []
-    for c in cols:
-        nulls = con.execute(
-            f"SELECT SUM(CASE WHEN {c} IS NULL THEN 1 ELSE 0 END) FROM '{parquet_path}'"
-        ).fetchone()[0]
-        nulls = int(nulls or 0)
-        rate = (nulls / total) if total else 0.0
-        results.append((c, nulls, rate))
-    return results
-
+    raw_rows = metric_value(rows, "raw", TABLE_LEVEL, "rows")
+    cleaned_rows = metric_value(rows, "cleaned", TABLE_LEVEL, "rows")
+    removed = raw_rows - cleaned_rows
+    rows.append((month_key, "cleaned", TABLE_LEVEL, "removed", removed))
+    rows.append((month_key, "cleaned", TABLE_LEVEL, "removed_ratio", (removed / raw_rows) if raw_rows else 0.0))
 
-def _min_max(con: duckdb.DuckDBPyConnection, parquet_path: str, col: str):
-    return con.execute(
-        f"SELECT MIN({col}), MAX({col}) FROM '{parquet_path}'"
-    ).fetchone()
+    for r in rules:
+        rows.append((month_key, "rules", r.name, "violations", float(rule_counts[r.name])))
 
+    if duplicates is not None:
+        rows.append((month_key, "dedup", TABLE_LEVEL, "within_month", float(duplicates.within_month)))
+        rows.append((month_key, "dedup", TABLE_LEVEL, "cross_month", float(duplicates.cross_month)))
 
-def _anomaly_counts(con: duckdb.DuckDBPyConnection, parquet_path: str, cfg: dict) -> dict:
-    min_dist = cfg["cleaning"]["trip_distance"]["min"]
-    max_dist = cfg["cleaning"]["trip_distance"]["max"]
-    min_fare = cfg["cleaning"]["fare_amount"]["min"]
-    require_time = cfg["cleaning"].get("require_valid_time_order", True)
+    return rows
 
-    counts = {}
 
-    counts["fare_negative"] = con.execute(
-        f"SELECT COUNT(*) FROM '{parquet_path}' WHERE fare_amount < {min_fare}"
-    ).fetchone()[0]
+def render_dq_report(year: int, month: int, rows: list[MetricRow], rules: list[CleaningRule]) -> str:
+    """Render the markdown DQ report of one month from its metric rows."""
 
-    counts["distance_out_of_range"] = con.execute(
-        f"SELECT COUNT(*) FROM '{parquet_path}' WHERE trip_distance < {min_dist} OR trip_distance > {max_dist}"
-    ).fetchone()[0]
+    def get(layer: str, column_name: str, metric: str):
+        return metric_value(rows, layer, column_name, metric)
 
-    if require_time:
-        counts["invalid_time_order"] = con.execute(
-            f"""
-            SELECT COUNT(*) FROM '{parquet_path}'
-            WHERE tpep_dropoff_datetime < tpep_pickup_datetime
-            """
-        ).fetchone()[0]
-    else:
-        counts["invalid_time_order"] = None
+    def fmt_pct(x: float) -> str:
+        return f"{x:.4%}"
 
-    return counts
+    ts = datetime.utcnow().isoformat() + "Z"
+    out = []
+
+    out.append(f"# Data Quality Report — {year}-{month:02d}\n\n")
+    out.append(f"Generated at: {ts}\n\n")
+
+    out.append("## Summary\n\n")
+    out.append(f"- Raw rows: **{int(get('raw', TABLE_LEVEL, 'rows')):,}**\n")
+    out.append(f"- Cleaned rows: **{int(get('cleaned', TABLE_LEVEL, 'rows')):,}**\n")
+    out.append(
+        f"- Removed: **{int(get('cleaned', TABLE_LEVEL, 'removed')):,}** "
+        f"({fmt_pct(get('cleaned', TABLE_LEVEL, 'removed_ratio'))})\n\n"
+    )
+
+    out.append("## Cleaning Rules (from config)\n\n")
+    for r in rules:
+        out.append(f"- {r.name}: {r.description}\n")
+    out.append("\n")
+
+    out.append("## Raw Anomaly Counts\n\n")
+    for r in rules:
+        out.append(f"- {r.name}: **{int(get('rules', r.name, 'violations')):,}**\n")
+    out.append("\n")
+
+    within = get("dedup", TABLE_LEVEL, "within_month")
+    if within is not None:
+        out.append("## Duplicates Removed\n\n")
+        out.append(f"- within month: **{int(within):,}**\n")
+        out.append(f"- already loaded by a neighbouring month: **{int(get('dedup', TABLE_LEVEL, 'cross_month')):,}**\n\n")
+
+    out.append("## Ranges (Raw vs Cleaned)\n\n")
+    out.append("| Metric | Raw | Cleaned |\n")
+    out.append("|---|---:|---:|\n")
+    for c in ("trip_distance", "fare_amount"):
+        for m in ("min", "max"):
+            out.append(f"| {c} {m} | {get('raw', c, m)} | {get('cleaned', c, m)} |\n")
+    out.append("\n")
+
+    out.append("## Null Rates (Key Columns)\n\n")
+    out.append("| Column | Raw nulls | Raw null rate | Cleaned nulls | Cleaned null rate |\n")
+    out.append("|---|---:|---:|---:|---:|\n")
+    for c in KEY_COLUMNS:
+        out.append(
+            f"| {c} | {int(get('raw', c, 'nulls')):,} | {fmt_pct(get('raw', c, 'null_rate'))} "
+            f"| {int(get('cleaned', c, 'nulls')):,} | {fmt_pct(get('cleaned', c, 'null_rate'))} |\n"
+        )
+
+    return "".join(out)
 
 
 def generate_dq_report(
     year: int,
     month: int,
     raw_path: str,
-    cleaned_path: str,
+    cleaned_path: str | None,
     cfg: dict,
     out_dir: str = "data/cleaned",
+    con: duckdb.DuckDBPyConnection | None = None,
+    cleaned_table: str | None = None,
+    rule_counts: dict[str, int] | None = None,
+    duplicates: DedupResult | None = None,
+    raw_profile: tuple | None = None,
+    cleaned_profile: tuple | None = None,
 ) -> str:
     """
-    Generate a markdown DQ report comparing raw vs cleaned datasets.
+    Compute the month's DQ metrics, store them as rows in the dq_metrics
+    dataset (see src.quality.metrics) and render the markdown DQ report
+    comparing raw vs cleaned datasets from those rows.
+    The cleaned side is read from `cleaned_table` on `con` when given
+    (fused transform+load), otherwise from the cleaned Parquet file.
+    Per-rule violation counts are taken from `rule_counts` (computed by the
+    cleaning pass) and only recomputed, in one scan, when not given.
+    `duplicates` adds the dedup counts when the dedup stage ran, and
+    `raw_profile` / `cleaned_profile` replace the scans of those layers
+    (see build_dq_metric_rows).
     Returns the report path.
     """
     os.makedirs(out_dir, exist_ok=True)
     report_path = os.path.join(out_dir, f"dq_report_{year}-{month:02d}.md")
+    month_key = f"{year}-{month:02d}"
 
-    con = duckdb.connect(database=":memory:")
+    owns_con = con is None
+    if owns_con:
+        con = duckdb.connect(database=":memory:")
 
-    raw_rows = _count(con, raw_path)
-    cleaned_rows = _count(con, cleaned_path)
-    removed = raw_rows - cleaned_rows
-    removed_ratio = (removed / raw_rows) if raw_rows else 0.0
-
-    key_cols = [
-        "tpep_pickup_datetime",
-        "tpep_dropoff_datetime",
-        "passenger_count",
-        "trip_distance",
-        "fare_amount",
-        "total_amount",
-        "PULocationID",
-        "DOLocationID",
-    ]
-
-    raw_nulls = _null_stats(con, raw_path, key_cols)
-    cleaned_nulls = _null_stats(con, cleaned_path, key_cols)
+    raw_source = f"'{raw_path}'"
+    cleaned_source = cleaned_table if cleaned_table else f"'{cleaned_path}'"
 
-    # Ranges (raw and cleaned)
-    raw_dist_min, raw_dist_max = _min_max(con, raw_path, "trip_distance")
-    raw_fare_min, raw_fare_max = _min_max(con, raw_path, "fare_amount")
+    rules = load_rules(cfg)
+    try:
+        if rule_counts is None:
+            rule_counts = _rule_counts(con, raw_source, rules)
+        rows = build_dq_metric_rows(
+            con, month_key, raw_source, cleaned_source, rules, rule_counts, duplicates, raw_profile, cleaned_profile
+        )
+    finally:
+        if owns_con:
+            con.close()
 
-    cln_dist_min, cln_dist_max = _min_max(con, cleaned_path, "trip_distance")
-    cln_fare_min, cln_fare_max = _min_max(con, cleaned_path, "fare_amount")
-
-    # Anomalies
-    raw_anom = _anomaly_counts(con, raw_path, cfg)
-
-    con.close()
-
-    ts = datetime.utcnow().isoformat() + "Z"
-
-    def fmt_pct(x: float) -> str:
-        return f"{x:.4%}"
+    write_dq_metrics(rows, month_key)
 
     with open(report_path, "w", encoding="utf-8") as f:
-        f.write(f"# Data Quality Report — {year}-{month:02d}\n\n")
-        f.write(f"Generated at: {ts}\n\n")
-
-        f.write("## Summary\n\n")
-        f.write(f"- Raw rows: **{raw_rows:,}**\n")
-        f.write(f"- Cleaned rows: **{cleaned_rows:,}**\n")
-        f.write(f"- Removed: **{removed:,}** ({fmt_pct(removed_ratio)})\n\n")
-
-        f.write("## Cleaning Rules (from config)\n\n")
-        f.write(f"- trip_distance in [{cfg['cleaning']['trip_distance']['min']}, {cfg['cleaning']['trip_distance']['max']}]\n")
-        f.write(f"- fare_amount >= {cfg['cleaning']['fare_amount']['min']}\n")
-        f.write(f"- require_valid_time_order = {cfg['cleaning'].get('require_valid_time_order', True)}\n\n")
-
-        f.write("## Raw Anomaly Counts\n\n")
-        f.write(f"- fare_negative: **{raw_anom['fare_negative']:,}**\n")
-        f.write(f"- distance_out_of_range: **{raw_anom['distance_out_of_range']:,}**\n")
-        if raw_anom["invalid_time_order"] is not None:
-            f.write(f"- invalid_time_order: **{raw_anom['invalid_time_order']:,}**\n")
-        f.write("\n")
-
-        f.write("## Ranges (Raw vs Cleaned)\n\n")
-        f.write("| Metric | Raw | Cleaned |\n")
-        f.write("|---|---:|---:|\n")
-        f.write(f"| trip_distance min | {raw_dist_min} | {cln_dist_min} |\n")
-        f.write(f"| trip_distance max | {raw_dist_max} | {cln_dist_max} |\n")
-        f.write(f"| fare_amount min | {raw_fare_min} | {cln_fare_min} |\n")
-        f.write(f"| fare_amount max | {raw_fare_max} | {cln_fare_max} |\n\n")
-
-        f.write("## Null Rates (Key Columns)\n\n")
-        f.write("| Column | Raw nulls | Raw null rate | Cleaned nulls | Cleaned null rate |\n")
-        f.write("|---|---:|---:|---:|---:|\n")
-        cleaned_map = {c: (n, r) for c, n, r in cleaned_nulls}
-        for c, rn, rr in raw_nulls:
-            cn, cr = cleaned_map[c]
-            f.write(f"| {c} | {rn:,} | {fmt_pct(rr)} | {cn:,} | {fmt_pct(cr)} |\n")
-
-    return report_path
\ No newline at end of file
+        f.write(render_dq_report(year, month, rows, rules))
+
+    return report_path
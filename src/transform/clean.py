@@ -1,15 +1,30 @@
 import os
 import duckdb
+from dataclasses import dataclass, field
 from datetime import datetime
 from src.config import load_config
+from src.lookup.trip_index import write_cleaned_parquet
 from src.quality.report import generate_dq_report
+from src.transform.compact_types import TypeCast, compact_select, load_type_map, plan_casts
+from src.transform.dedup import DedupResult, configure_spill, deduplicate, drop_dedup_state
+from src.transform.rules import (
+    CleaningRule,
+    keep_predicate,
+    load_rules,
+    rule_counts_query,
+    violation_mask_sql,
+)
 
 
 config = load_config()
 
-min_dist = config["cleaning"]["trip_distance"]["min"]
-max_dist = config["cleaning"]["trip_distance"]["max"]
-min_fare = config["cleaning"]["fare_amount"]["min"]
+rules = load_rules(config)
+quarantine_enabled = config["cleaning"].get("quarantine", True)
+dedup_config = config.get("dedup", {})
+type_map = load_type_map(config)
+
+# Temp table holding the raw rows tagged with their violation bitmask
+TAGGED_TABLE = "_cleaning_tagged"
 
 # Columns that must exist for the cleaning SQL to work (and optional type hint: substring to match)
 REQUIRED_COLUMNS = {
@@ -33,6 +48,20 @@ class SchemaValidationError(Exception):
     pass
 
 
+@dataclass
+class CleaningResult:
+    raw_count: int
+    cleaned_count: int
+    # Rows breaking each rule, keyed by rule name (a row can break several)
+    rule_counts: dict[str, int]
+    quarantine_path: str | None = None
+    duplicates: DedupResult | None = None
+    # Casts that every kept value survives unchanged (applied to the clean rows)
+    casts: list[TypeCast] = field(default_factory=list)
+    # Casts not applied, with the number of kept values that would not fit
+    skipped_casts: list[tuple[TypeCast, int]] = field(default_factory=list)
+
+
 def get_actual_schema(con: duckdb.DuckDBPyConnection, raw_path: str) -> list[tuple[str, str]]:
     """Return list of (column_name, column_type) for the parquet file."""
     rows = con.execute(f"DESCRIBE SELECT * FROM '{raw_path}'").fetchall()
@@ -69,26 +98,141 @@ def build_filename(year: int, month: int) -> str:
     return f"yellow_tripdata_{year}-{month:02d}.parquet"
 
 
-def run_transform(year: int, month: int):
-    os.makedirs("data/cleaned", exist_ok=True)
+def build_quarantine_path(year: int, month: int) -> str:
+    return os.path.join("data/quarantine", build_filename(year, month))
 
-    filename = build_filename(year, month)
 
-    raw_path = os.path.join("data/raw", filename)
-    cleaned_path = os.path.join("data/cleaned", filename)
+def apply_cleaning(
+    con: duckdb.DuckDBPyConnection,
+    raw_path: str,
+    year: int,
+    month: int,
+    rules: list[CleaningRule] = rules,
+    quarantine: bool | None = None,
+    casts: list[TypeCast] | None = None,
+    source: str | None = None,
+    quarantine_path: str | None = None,
+) -> tuple[str, CleaningResult]:
+    """
+    Evaluate every cleaning rule in one vectorized pass over the raw file
+    (or over `source`, a relation such as one slice of it).
 
-    if not os.path.exists(raw_path):
-        raise FileNotFoundError(f"Raw file not found: {raw_path}")
+    With quarantine on, the raw rows are scanned once into a temp table tagged
+    with a `_violations` bitmask (bit = rule.bit); rejected rows are written to
+    data/quarantine/ (or `quarantine_path`) with that column. With quarantine off, the rule predicates
+    are left on the raw scan so DuckDB can push them into the Parquet reader.
 
-    print(f"Transforming {filename}...")
+    The same counting pass checks the kept rows against `casts`; the safe
+    ones end up in `result.casts`, the others in `result.skipped_casts`.
+    The casts themselves are not applied here (see finish_clean_rows).
 
-    con = duckdb.connect(database=":memory:")
+    Returns the SELECT producing the clean rows and the row/rule counts.
+    Call drop_cleaning_state() once the clean rows have been consumed.
+    """
+    if quarantine is None:
+        quarantine = quarantine_enabled
+    casts = casts or []
+    checks = [c.lossy_sql() for c in casts]
+    source = source or f"'{raw_path}'"
+
+    if quarantine:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {TAGGED_TABLE} AS
+            SELECT *, {violation_mask_sql(rules)} AS _violations
+            FROM {source};
+        """)
+        counts = con.execute(rule_counts_query(rules, TAGGED_TABLE, "_violations", checks)).fetchone()
+
+        quarantine_path = quarantine_path or build_quarantine_path(year, month)
+        os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+        con.execute(f"""
+            COPY (SELECT * FROM {TAGGED_TABLE} WHERE _violations <> 0)
+            TO '{quarantine_path}'
+            (FORMAT PARQUET);
+        """)
+        clean_sql = f"SELECT * EXCLUDE (_violations) FROM {TAGGED_TABLE} WHERE _violations = 0"
+    else:
+        quarantine_path = None
+        counts = con.execute(rule_counts_query(rules, source, kept_checks=checks)).fetchone()
+        clean_sql = f"SELECT * FROM {source} WHERE {keep_predicate(rules)}"
+
+    result = CleaningResult(
+        raw_count=counts[0],
+        cleaned_count=counts[1],
+        rule_counts={r.name: n for r, n in zip(rules, counts[2:])},
+        quarantine_path=quarantine_path,
+    )
+    for cast, lossy in zip(casts, counts[2 + len(rules):]):
+        if lossy:
+            result.skipped_casts.append((cast, lossy))
+        else:
+            result.casts.append(cast)
+    return clean_sql, result
+
+
+def prepare_clean_rows(
+    con: duckdb.DuckDBPyConnection,
+    raw_path: str,
+    year: int,
+    month: int,
+) -> tuple[str, CleaningResult]:
+    """
+    Apply the cleaning rules and, when `dedup.enabled`, drop duplicate trips,
+    then narrow columns to their `compact_types` target types. Casts come
+    last so dedup keys hash the raw values, whatever the type map.
+    Returns the SELECT producing the final clean rows and the counts
+    (`cleaned_count` is net of duplicates).
+    """
+    casts = plan_casts(get_actual_schema(con, raw_path), type_map)
+    clean_sql, result = apply_cleaning(con, raw_path, year, month, casts=casts)
+    return finish_clean_rows(con, clean_sql, result, year, month), result
 
-    # Schema validation: fail fast before cleaning
+
+def warn_skipped_casts(result: CleaningResult) -> None:
+    for cast, lossy in result.skipped_casts:
+        print(
+            f"Warning: keeping {cast.column} as {cast.source_type}: "
+            f"{lossy} value(s) do not fit {cast.target_type}"
+        )
+
+
+def finish_clean_rows(
+    con: duckdb.DuckDBPyConnection,
+    clean_sql: str,
+    result: CleaningResult,
+    year: int,
+    month: int,
+) -> str:
+    """
+    Dedup and compact-type steps after the rules (see prepare_clean_rows);
+    updates `result` and returns the SELECT producing the final clean rows.
+    """
+    warn_skipped_casts(result)
+
+    if dedup_config.get("enabled", False):
+        clean_sql, dups = deduplicate(con, clean_sql, result.cleaned_count, year, month, dedup_config)
+        # The dedup table holds its own copy of the rows; free the tagged table early
+        con.execute(f"DROP TABLE IF EXISTS {TAGGED_TABLE};")
+        result.duplicates = dups
+        result.cleaned_count -= dups.total
+
+    return compact_select(clean_sql, result.casts)
+
+
+def drop_cleaning_state(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"DROP TABLE IF EXISTS {TAGGED_TABLE};")
+    drop_dedup_state(con)
+
+
+def validate_raw_schema(con: duckdb.DuckDBPyConnection, raw_path: str, year: int, month: int) -> None:
+    """
+    Validate the raw file schema; on failure write the failure report and raise
+    SchemaValidationError (no cleaning is run).
+    """
     actual_schema = get_actual_schema(con, raw_path)
     schema_errors = validate_schema(
         actual_schema,
-        REQUIRED_COLUMNS,
+        REQUIRED_COLUMNS | {r.column for r in rules if r.column},
         type_hints=EXPECTED_TYPE_HINT,
     )
     if schema_errors:
@@ -110,39 +254,18 @@ def run_transform(year: int, month: int):
 
     print("Schema validation: passed")
 
-    # Count raw rows
-    raw_count = con.execute(
-        f"SELECT COUNT(*) FROM '{raw_path}'"
-    ).fetchone()[0]
-
-    print(f"Raw rows: {raw_count}")
-
-    # Apply cleaning rules
-    con.execute(f"""
-        COPY (
-            SELECT *
-            FROM '{raw_path}'
-            WHERE trip_distance >= {min_dist}
-              AND trip_distance <= {max_dist}
-              AND fare_amount >= {min_fare}
-              AND tpep_dropoff_datetime >= tpep_pickup_datetime
-        )
-        TO '{cleaned_path}'
-        (FORMAT PARQUET);
-    """)
-
-    # Count cleaned rows
-    cleaned_count = con.execute(
-        f"SELECT COUNT(*) FROM '{cleaned_path}'"
-    ).fetchone()[0]
 
+def write_cleaning_report(year: int, month: int, result: CleaningResult) -> str:
+    """Print the row count summary and write the cleaning report. Returns the report path."""
+    raw_count = result.raw_count
+    cleaned_count = result.cleaned_count
     removed_count = raw_count - cleaned_count
     removed_ratio = removed_count / raw_count if raw_count > 0 else 0
 
     print(f"Cleaned rows: {cleaned_count}")
     print(f"Removed rows: {removed_count} ({removed_ratio:.4%})")
 
-    # Write cleaning report
+    os.makedirs("data/cleaned", exist_ok=True)
     report_path = f"data/cleaned/cleaning_report_{year}-{month:02d}.txt"
 
     with open(report_path, "w") as f:
@@ -153,14 +276,65 @@ def run_transform(year: int, month: int):
         f.write(f"Cleaned rows: {cleaned_count}\n")
         f.write(f"Removed rows: {removed_count}\n")
         f.write(f"Removed ratio: {removed_ratio:.4%}\n\n")
-        f.write("Applied Rules:\n")
-        f.write("- trip_distance > 0\n")
-        f.write("- trip_distance < 100\n")
-        f.write("- fare_amount >= 0\n")
-        f.write("- dropoff >= pickup\n")
+        f.write("Applied Rules (violations; bit in quarantine _violations):\n")
+        for r in rules:
+            f.write(f"- {r.name}: {r.description} -> {result.rule_counts[r.name]} (bit {r.bit})\n")
+        if result.duplicates is not None:
+            f.write("\nDuplicates removed:\n")
+            f.write(f"- within month: {result.duplicates.within_month}\n")
+            f.write(f"- already loaded by a neighbouring month: {result.duplicates.cross_month}\n")
+        if result.casts or result.skipped_casts:
+            f.write("\nColumn types:\n")
+            for cast in result.casts:
+                f.write(f"- {cast.column}: {cast.source_type} -> {cast.target_type}\n")
+            for cast, lossy in result.skipped_casts:
+                f.write(
+                    f"- {cast.column}: kept {cast.source_type} "
+                    f"({lossy} values do not fit {cast.target_type})\n"
+                )
+        if result.quarantine_path:
+            f.write(f"\nQuarantined rows written to: {result.quarantine_path}\n")
 
     print(f"Cleaning report written to: {report_path}")
+    return report_path
+
+
+def run_transform(year: int, month: int):
+    os.makedirs("data/cleaned", exist_ok=True)
+
+    filename = build_filename(year, month)
+
+    raw_path = os.path.join("data/raw", filename)
+    cleaned_path = os.path.join("data/cleaned", filename)
+
+    if not os.path.exists(raw_path):
+        raise FileNotFoundError(f"Raw file not found: {raw_path}")
+
+    print(f"Transforming {filename}...")
+
+    con = duckdb.connect(database=":memory:")
+    configure_spill(con, dedup_config)
+
+    # Schema validation: fail fast before cleaning
+    validate_raw_schema(con, raw_path, year, month)
+
+    # Apply cleaning rules (single pass; counts come from the same pass) and dedup
+    clean_sql, result = prepare_clean_rows(con, raw_path, year, month)
+    print(f"Raw rows: {result.raw_count}")
 
-    dq_path = generate_dq_report(year, month, raw_path, cleaned_path, config)
+    write_cleaned_parquet(con, clean_sql, cleaned_path)
+    drop_cleaning_state(con)
+
+    write_cleaning_report(year, month, result)
+
+    dq_path = generate_dq_report(
+        year,
+        month,
+        raw_path,
+        cleaned_path,
+        config,
+        rule_counts=result.rule_counts,
+        duplicates=result.duplicates,
+    )
     print(f"DQ report written to: {dq_path}")
-    print(f"Transform completed for {filename}")
\ No newline at end of file
+    print(f"Transform completed for {filename}")
@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class TypeCast:
+    column: str
+    source_type: str
+    target_type: str
+
+    def lossy_sql(self) -> str:
+        """
+        True for a value that does not survive the cast unchanged: out of
+        range or not convertible (TRY_CAST gives NULL), or changed by it
+        (fractional passenger counts, sub-cent amounts, ...).
+        """
+        c = self.column
+        return (
+            f"{c} IS NOT NULL AND "
+            f"TRY_CAST({c} AS {self.target_type})::{self.source_type} IS DISTINCT FROM {c}"
+        )
+
+
+def load_type_map(cfg: dict) -> dict[str, str]:
+    """Column -> target type from `compact_types`; empty when disabled."""
+    section = cfg.get("compact_types", {})
+    if not section.get("enabled", False):
+        return {}
+    return dict(section.get("columns", {}))
+
+
+def plan_casts(actual_schema: list[tuple[str, str]], type_map: dict[str, str]) -> list[TypeCast]:
+    """
+    Casts for the mapped columns present in the file (names match
+    case-insensitively, e.g. airport_fee / Airport_fee). Columns already of
+    the target type are skipped.
+    """
+    targets = {name.lower(): typ for name, typ in type_map.items()}
+    casts = []
+    for name, typ in actual_schema:
+        target = targets.get(name.lower())
+        if target and target.replace(" ", "").upper() != typ.replace(" ", "").upper():
+            casts.append(TypeCast(name, typ, target))
+    return casts
+
+
+def compact_select(source_sql: str, casts: list[TypeCast]) -> str:
+    """Rows of `source_sql` with `casts` applied in place (column order unchanged)."""
+    if not casts:
+        return source_sql
+    replaced = ", ".join(f"CAST({c.column} AS {c.target_type}) AS {c.column}" for c in casts)
+    return f"SELECT * REPLACE ({replaced}) FROM ({source_sql})"
@@ -0,0 +1,167 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+import duckdb
+
+
+KEYS_DIR = "data/dedup_keys"
+
+# Temp table holding the deduplicated clean rows plus their `_dedup_key`
+DEDUP_TABLE = "_dedup_rows"
+
+DEFAULT_KEY = [
+    "VendorID",
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+    "PULocationID",
+    "DOLocationID",
+    "fare_amount",
+    "total_amount",
+]
+
+
+@dataclass
+class DedupResult:
+    within_month: int
+    cross_month: int
+
+    @property
+    def total(self) -> int:
+        return self.within_month + self.cross_month
+
+
+def build_keys_path(year: int, month: int) -> str:
+    return os.path.join(KEYS_DIR, f"yellow_tripdata_{year}-{month:02d}.parquet")
+
+
+def neighbour_months(year: int, month: int, lookback: int) -> list[tuple[int, int]]:
+    """Months within `lookback` of (year, month) on either side, excluding itself."""
+    base = year * 12 + (month - 1)
+    out = []
+    for offset in range(-lookback, lookback + 1):
+        if offset == 0:
+            continue
+        y, m = divmod(base + offset, 12)
+        out.append((y, m + 1))
+    return out
+
+
+def configure_spill(con: duckdb.DuckDBPyConnection, dedup_cfg: dict) -> None:
+    """
+    Point a freshly opened connection's spill files at `dedup.temp_directory`.
+    DuckDB refuses to switch the directory once something was spilled, so
+    this is done once, by whoever opens the connection, not per dedup.
+    """
+    temp_dir = dedup_cfg.get("temp_directory", "data/tmp/duckdb")
+    os.makedirs(temp_dir, exist_ok=True)
+    con.execute(f"SET temp_directory = '{temp_dir}';")
+
+
+@lru_cache(maxsize=1)
+def _default_memory_limit() -> str:
+    con = duckdb.connect(database=":memory:")
+    try:
+        return con.execute("SELECT current_setting('memory_limit');").fetchone()[0]
+    finally:
+        con.close()
+
+
+def key_hash_sql(key_columns: list[str]) -> str:
+    return f"hash({', '.join(key_columns)})"
+
+
+def deduplicate(
+    con: duckdb.DuckDBPyConnection,
+    source_sql: str,
+    rows_in: int,
+    year: int,
+    month: int,
+    dedup_cfg: dict,
+    keys_path: str | None = None,
+) -> tuple[str, DedupResult]:
+    """
+    Drop duplicate trips from the rows of `source_sql`.
+
+    Rows are keyed by a 64-bit hash of the configured key columns. Within the
+    month, one row per key is kept; the window is partitioned by that hash,
+    which DuckDB radix-partitions and spills to `temp_directory` once
+    `memory_limit` is reached, so the month never has to fit in memory.
+    Keys already owned by a neighbouring month (their key files in
+    data/dedup_keys/) are then removed, so overlapping re-loads are not
+    counted twice. The month's own key file is rewritten afterwards (or
+    `keys_path`, when the month is deduplicated in disjoint key partitions).
+
+    `rows_in` is the row count of `source_sql` (known from the cleaning pass).
+    Returns the SELECT producing the deduplicated rows and the counts.
+
+    `memory_limit` is global to the caller's database (the warehouse in the
+    fused path), so it is only applied while the window runs, and only on
+    a connection still at DuckDB's default limit, which RESET restores
+    exactly; a limit the caller chose is left alone. Spill files go to the
+    connection's temp_directory (see configure_spill).
+    """
+    key_columns = dedup_cfg.get("key", DEFAULT_KEY)
+
+    limit = dedup_cfg.get("memory_limit")
+    current = con.execute("SELECT current_setting('memory_limit');").fetchone()[0]
+    scoped = limit is not None and current == _default_memory_limit()
+    if scoped:
+        con.execute(f"SET memory_limit = '{limit}';")
+    try:
+        return _deduplicate(con, source_sql, rows_in, year, month, key_columns, dedup_cfg, keys_path)
+    finally:
+        if scoped:
+            con.execute("RESET memory_limit;")
+
+
+def _deduplicate(
+    con: duckdb.DuckDBPyConnection,
+    source_sql: str,
+    rows_in: int,
+    year: int,
+    month: int,
+    key_columns: list[str],
+    dedup_cfg: dict,
+    keys_path: str | None,
+) -> tuple[str, DedupResult]:
+    lookback = dedup_cfg.get("cross_month_lookback", 1)
+
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {DEDUP_TABLE} AS
+        SELECT * EXCLUDE (_dedup_rn)
+        FROM (
+            SELECT *, row_number() OVER (PARTITION BY _dedup_key) AS _dedup_rn
+            FROM (SELECT *, {key_hash_sql(key_columns)} AS _dedup_key FROM ({source_sql}))
+        )
+        WHERE _dedup_rn = 1;
+    """)
+    distinct_rows = con.execute(f"SELECT COUNT(*) FROM {DEDUP_TABLE}").fetchone()[0]
+
+    cross_month = 0
+    neighbour_files = [
+        build_keys_path(y, m)
+        for y, m in neighbour_months(year, month, lookback)
+        if os.path.exists(build_keys_path(y, m))
+    ]
+    if neighbour_files:
+        file_list = ", ".join(f"'{p}'" for p in neighbour_files)
+        cross_month = con.execute(f"""
+            DELETE FROM {DEDUP_TABLE}
+            WHERE _dedup_key IN (SELECT _dedup_key FROM read_parquet([{file_list}]));
+        """).fetchone()[0]
+
+    keys_path = keys_path or build_keys_path(year, month)
+    os.makedirs(os.path.dirname(keys_path), exist_ok=True)
+    con.execute(f"""
+        COPY (SELECT _dedup_key FROM {DEDUP_TABLE})
+        TO '{keys_path}'
+        (FORMAT PARQUET);
+    """)
+
+    result = DedupResult(within_month=rows_in - distinct_rows, cross_month=cross_month)
+    return f"SELECT * EXCLUDE (_dedup_key) FROM {DEDUP_TABLE}", result
+
+
+def drop_dedup_state(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"DROP TABLE IF EXISTS {DEDUP_TABLE};")
@@ -0,0 +1,401 @@
+import glob
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+
+import duckdb
+
+from src.config import load_config
+from src.lookup.trip_index import TIME_COLUMN, write_cleaned_parquet
+from src.quality.metrics import merge_profile_aggregates, profile_aggregates
+from src.quality.report import generate_dq_report
+from src.transform.clean import (
+    TAGGED_TABLE,
+    CleaningResult,
+    apply_cleaning,
+    build_filename,
+    build_quarantine_path,
+    dedup_config,
+    drop_cleaning_state,
+    get_actual_schema,
+    type_map,
+    validate_raw_schema,
+    warn_skipped_casts,
+    write_cleaning_report,
+)
+from src.transform.compact_types import TypeCast, compact_select, plan_casts
+from src.transform.dedup import (
+    DEFAULT_KEY,
+    DedupResult,
+    build_keys_path,
+    configure_spill,
+    deduplicate,
+    key_hash_sql,
+)
+
+
+config = load_config()
+
+# Per-month scratch directory for the slice and partition outputs; removed after the merge
+PARALLEL_DIR = os.path.join("data", "tmp", "parallel")
+
+_MEMORY_UNITS = {
+    "B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12,
+    "KIB": 2**10, "MIB": 2**20, "GIB": 2**30, "TIB": 2**40,
+}
+
+
+@dataclass(frozen=True)
+class RowSlice:
+    index: int
+    row_start: int
+    # Inclusive; row_end < row_start for an empty file
+    row_end: int
+
+
+@dataclass
+class PartitionResult:
+    index: int
+    rows_in: int
+    duplicates: DedupResult | None
+    # profile_aggregates() of the partition's final rows (cleaned layer)
+    profile: tuple
+    path: str
+    keys_path: str | None
+
+
+def parallel_settings() -> dict:
+    return config.get("parallel_transform", {})
+
+
+def parse_memory(value: str) -> int:
+    """'4GB', '512MiB', ... -> bytes (DuckDB's units: KB/MB/GB are powers of 1000)."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]i?B|B)?\s*", str(value), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Invalid memory size: {value!r}")
+    return int(float(m.group(1)) * _MEMORY_UNITS[(m.group(2) or "B").upper()])
+
+
+def plan_slices(row_group_rows: list[int], workers: int) -> list[RowSlice]:
+    """
+    Split a file's row groups into at most `workers` contiguous slices of
+    about equal row count. Slices never cut through a row group.
+    """
+    total = sum(row_group_rows)
+    n = min(workers, len(row_group_rows))
+    if n == 0 or total == 0:
+        return [RowSlice(0, 0, -1)]
+
+    slices = []
+    first, cum = 0, 0
+    for i, rows in enumerate(row_group_rows):
+        cum += rows
+        if cum > first and (cum >= (len(slices) + 1) * total / n or i == len(row_group_rows) - 1):
+            slices.append(RowSlice(len(slices), first, cum - 1))
+            first = cum
+    return slices
+
+
+def partition_sql(key_columns: list[str] | None, boundaries: list) -> str:
+    """
+    Partition number of a clean row. Rows are split into pickup-time ranges
+    at `boundaries`, so partitions concatenated in order are sorted by
+    pickup time. Duplicates share their pickup time as long as it is part
+    of the dedup key (`key_columns`, None when dedup is off); otherwise the
+    partitions are hash ranges of the key instead.
+    """
+    n = len(boundaries) + 1
+    if key_columns is not None and TIME_COLUMN not in key_columns:
+        return f"({key_hash_sql(key_columns)} % {n})"
+    if n == 1:
+        return "0"
+    steps = " + ".join(f"({TIME_COLUMN} >= TIMESTAMP '{b}')::INTEGER" for b in boundaries)
+    return f"COALESCE({steps}, 0)"
+
+
+def _slice_source(raw_path: str, row_slice: RowSlice) -> str:
+    return f"""(
+        SELECT * EXCLUDE (file_row_number)
+        FROM read_parquet('{raw_path}', file_row_number = true)
+        WHERE file_row_number BETWEEN {row_slice.row_start} AND {row_slice.row_end}
+    )"""
+
+
+def _connect_worker(memory_limit: str, threads: int, spill_dir: str) -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect(database=":memory:")
+    con.execute(f"SET memory_limit = '{memory_limit}';")
+    con.execute(f"SET threads = {threads};")
+    configure_spill(con, {"temp_directory": spill_dir})
+    return con
+
+
+def _clean_slice(
+    raw_path: str,
+    year: int,
+    month: int,
+    row_slice: RowSlice,
+    casts: list[TypeCast],
+    part_expr: str,
+    work_dir: str,
+    memory_limit: str,
+    threads: int,
+) -> tuple[CleaningResult, tuple, str]:
+    """
+    Phase 1 worker: clean one slice of the raw file. Returns its partial
+    cleaning counts, its raw-layer profile aggregates and the directory of
+    its clean rows, split into partitions by `part_expr` (hive-style
+    `_part=N` subdirectories). Quarantined rows go to a part file too.
+    """
+    con = _connect_worker(memory_limit, threads, os.path.join(work_dir, f"spill_slice_{row_slice.index:04d}"))
+    try:
+        source = _slice_source(raw_path, row_slice)
+        clean_sql, result = apply_cleaning(
+            con,
+            raw_path,
+            year,
+            month,
+            casts=casts,
+            source=source,
+            quarantine_path=os.path.join(work_dir, f"quarantine_{row_slice.index:04d}.parquet"),
+        )
+        # With quarantine on, the slice is already materialized in the tagged table
+        if result.quarantine_path:
+            source = f"(SELECT * EXCLUDE (_violations) FROM {TAGGED_TABLE})"
+        raw_profile = profile_aggregates(con, source)
+
+        slice_dir = os.path.join(work_dir, f"slice_{row_slice.index:04d}")
+        con.execute(f"""
+            COPY (SELECT *, {part_expr} AS _part FROM ({clean_sql}))
+            TO '{slice_dir}'
+            (FORMAT PARQUET, PARTITION_BY (_part));
+        """)
+        drop_cleaning_state(con)
+    finally:
+        con.close()
+    return result, raw_profile, slice_dir
+
+
+def _finish_partition(
+    year: int,
+    month: int,
+    index: int,
+    files: list[str],
+    casts: list[TypeCast],
+    work_dir: str,
+    memory_limit: str,
+    threads: int,
+) -> PartitionResult:
+    """
+    Phase 2 worker: one partition of the month's clean rows, collected from
+    every slice. All copies of a trip land in the same partition, so the
+    partition is deduplicated on its own (its keys go to a part key file),
+    narrowed to the compact types, sorted by pickup time and written out.
+    """
+    con = _connect_worker(memory_limit, threads, os.path.join(work_dir, f"spill_part_{index:04d}"))
+    try:
+        file_list = ", ".join(f"'{f}'" for f in files)
+        clean_sql = f"SELECT * FROM read_parquet([{file_list}], hive_partitioning = false)"
+        rows_in = con.execute(f"SELECT COUNT(*) FROM ({clean_sql})").fetchone()[0]
+
+        dups, keys_path = None, None
+        if dedup_config.get("enabled", False):
+            keys_path = os.path.join(work_dir, f"keys_{index:04d}.parquet")
+            clean_sql, dups = deduplicate(con, clean_sql, rows_in, year, month, dedup_config, keys_path=keys_path)
+
+        part_path = os.path.join(work_dir, f"clean_{index:04d}.parquet")
+        con.execute(f"""
+            COPY (SELECT * FROM ({compact_select(clean_sql, casts)}) ORDER BY {TIME_COLUMN})
+            TO '{part_path}'
+            (FORMAT PARQUET);
+        """)
+        profile = profile_aggregates(con, f"'{part_path}'")
+        drop_cleaning_state(con)
+    finally:
+        con.close()
+    return PartitionResult(index, rows_in, dups, profile, part_path, keys_path)
+
+
+def merge_cleaning_results(results: list[CleaningResult], casts: list[TypeCast]) -> CleaningResult:
+    """Sum the slices' counts; a cast stays safe only if no slice found a lossy value."""
+    merged = CleaningResult(
+        raw_count=sum(r.raw_count for r in results),
+        cleaned_count=sum(r.cleaned_count for r in results),
+        rule_counts={name: sum(r.rule_counts[name] for r in results) for name in results[0].rule_counts},
+    )
+    for cast in casts:
+        lossy = sum(n for r in results for c, n in r.skipped_casts if c == cast)
+        if lossy:
+            merged.skipped_casts.append((cast, lossy))
+        else:
+            merged.casts.append(cast)
+    return merged
+
+
+def merge_duplicates(parts: list[PartitionResult]) -> DedupResult | None:
+    if not parts or parts[0].duplicates is None:
+        return None
+    return DedupResult(
+        within_month=sum(p.duplicates.within_month for p in parts),
+        cross_month=sum(p.duplicates.cross_month for p in parts),
+    )
+
+
+def run_transform_parallel(year: int, month: int, workers: int | None = None):
+    """
+    Transform one month with its work split across worker processes.
+
+    Phase 1: each worker cleans a contiguous range of raw row groups (read
+    through a file_row_number filter, so only its own row groups are
+    decoded), returns its rule counts, cast checks and raw DQ aggregates,
+    and writes its clean rows split into pickup-time partitions (bounded by
+    approximate quantiles of the raw pickup times).
+
+    Phase 2: each worker takes one partition from all slices and runs the
+    steps that need whole trips together: dedup, the compact-type casts
+    (decided from all slices' checks) and the sort. It returns the
+    partition's cleaned-layer DQ aggregates.
+
+    The merge only concatenates: the sorted partitions into the cleaned
+    file (then indexed), the part key files into the month's dedup key
+    file and the quarantine parts; the reports are built from the summed
+    counts and aggregates. Each worker gets an equal share of
+    `parallel_transform.memory_budget`. The outputs match run_transform.
+    """
+    settings = parallel_settings()
+    workers = workers or settings.get("workers") or os.cpu_count() or 1
+    budget = parse_memory(settings.get("memory_budget", "4GB"))
+
+    filename = build_filename(year, month)
+    raw_path = os.path.join("data/raw", filename)
+    cleaned_path = os.path.join("data/cleaned", filename)
+    if not os.path.exists(raw_path):
+        raise FileNotFoundError(f"Raw file not found: {raw_path}")
+
+    os.makedirs("data/cleaned", exist_ok=True)
+    work_dir = os.path.join(PARALLEL_DIR, os.path.splitext(filename)[0])
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    dedup_on = dedup_config.get("enabled", False)
+    key_columns = dedup_config.get("key", DEFAULT_KEY) if dedup_on else None
+
+    con = duckdb.connect(database=":memory:")
+    try:
+        con.execute(f"SET memory_limit = '{budget // 2**20}MiB';")
+        configure_spill(con, dedup_config)
+        validate_raw_schema(con, raw_path, year, month)
+        casts = plan_casts(get_actual_schema(con, raw_path), type_map)
+
+        row_group_rows = [r[0] for r in con.execute(f"""
+            SELECT row_group_num_rows
+            FROM (SELECT DISTINCT row_group_id, row_group_num_rows FROM parquet_metadata('{raw_path}'))
+            ORDER BY row_group_id
+        """).fetchall()]
+        slices = plan_slices(row_group_rows, workers)
+        n = len(slices)
+        per_worker = f"{max(budget // n // 2**20, 64)}MiB"
+        threads = max(1, (os.cpu_count() or 1) // n)
+
+        boundaries = []
+        if n > 1:
+            quantiles = ", ".join(str(k / n) for k in range(1, n))
+            boundaries = con.execute(
+                f"SELECT approx_quantile({TIME_COLUMN}, [{quantiles}]) FROM read_parquet('{raw_path}')"
+            ).fetchone()[0] or []
+        part_expr = partition_sql(key_columns, boundaries)
+
+        print(
+            f"Transforming {filename} in {n} slice(s) and partition(s) "
+            f"({len(row_group_rows)} row groups, {per_worker} and {threads} thread(s) per worker)..."
+        )
+
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=n, mp_context=get_context("spawn")) as pool:
+            futures = [
+                pool.submit(_clean_slice, raw_path, year, month, s, casts, part_expr, work_dir, per_worker, threads)
+                for s in slices
+            ]
+            sliced = [f.result() for f in futures]
+            cleaned_at = time.perf_counter()
+
+            results = [s[0] for s in sliced]
+            result = merge_cleaning_results(results, casts)
+            raw_profile = merge_profile_aggregates([s[1] for s in sliced])
+            print(f"Raw rows: {result.raw_count}")
+            warn_skipped_casts(result)
+
+            partition_files = {}
+            for p in range(len(boundaries) + 1):
+                files = sorted(glob.glob(os.path.join(work_dir, "slice_*", f"_part={p}", "*.parquet")))
+                if files:
+                    partition_files[p] = files
+            futures = [
+                pool.submit(_finish_partition, year, month, p, files, result.casts, work_dir, per_worker, threads)
+                for p, files in partition_files.items()
+            ]
+            parts = [f.result() for f in futures]
+        finished_at = time.perf_counter()
+
+        result.duplicates = merge_duplicates(parts)
+        if result.duplicates is not None:
+            result.cleaned_count -= result.duplicates.total
+
+        quarantine_parts = [r.quarantine_path for r in results if r.quarantine_path]
+        if quarantine_parts:
+            os.makedirs("data/quarantine", exist_ok=True)
+            result.quarantine_path = build_quarantine_path(year, month)
+            part_list = ", ".join(f"'{p}'" for p in quarantine_parts)
+            con.execute(f"""
+                COPY (SELECT * FROM read_parquet([{part_list}]))
+                TO '{result.quarantine_path}'
+                (FORMAT PARQUET);
+            """)
+
+        if dedup_on:
+            keys_path = build_keys_path(year, month)
+            os.makedirs(os.path.dirname(keys_path), exist_ok=True)
+            key_parts = [p.keys_path for p in parts]
+            if key_parts:
+                part_list = ", ".join(f"'{p}'" for p in key_parts)
+                key_sql = f"SELECT _dedup_key FROM read_parquet([{part_list}])"
+            else:
+                key_sql = "SELECT NULL::UBIGINT AS _dedup_key WHERE FALSE"
+            con.execute(f"COPY ({key_sql}) TO '{keys_path}' (FORMAT PARQUET);")
+
+        if parts:
+            part_list = ", ".join(f"'{p.path}'" for p in parts)
+            clean_sql = f"SELECT * FROM read_parquet([{part_list}])"
+        else:
+            # No row survived cleaning: still write the (empty) cleaned file
+            clean_sql = compact_select(f"SELECT * FROM read_parquet('{raw_path}') WHERE FALSE", result.casts)
+        write_cleaned_parquet(
+            con, clean_sql, cleaned_path, presorted=TIME_COLUMN in (key_columns or [TIME_COLUMN])
+        )
+        print(
+            f"Slices cleaned in {cleaned_at - started:.1f}s, partitions finished in "
+            f"{finished_at - cleaned_at:.1f}s, merged in {time.perf_counter() - finished_at:.1f}s"
+        )
+    finally:
+        con.close()
+
+    write_cleaning_report(year, month, result)
+
+    dq_path = generate_dq_report(
+        year,
+        month,
+        raw_path,
+        cleaned_path,
+        config,
+        rule_counts=result.rule_counts,
+        duplicates=result.duplicates,
+        raw_profile=raw_profile,
+        cleaned_profile=merge_profile_aggregates([p.profile for p in parts]) if parts else None,
+    )
+    print(f"DQ report written to: {dq_path}")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Parallel transform completed for {filename}")
@@ -0,0 +1,129 @@
+from dataclasses import dataclass
+
+
+# Violation bitmasks are stored as UBIGINT, so at most 64 rules
+MAX_RULES = 64
+
+
+class RuleConfigError(Exception):
+    """Raised when the cleaning rules in config are malformed."""
+
+    pass
+
+
+@dataclass(frozen=True)
+class CleaningRule:
+    name: str
+    # SQL condition a row must satisfy to be kept
+    predicate: str
+    description: str
+    bit: int
+    # Column for range rules (None for free-form `expr` rules)
+    column: str | None = None
+
+    @property
+    def mask(self) -> int:
+        return 1 << self.bit
+
+    def violation_sql(self) -> str:
+        """SQL boolean that is true when a row breaks this rule (NULL counts as broken)."""
+        return f"NOT coalesce(({self.predicate}), FALSE)"
+
+
+def _legacy_rule_specs(cleaning: dict) -> list[dict]:
+    """Translate the pre-rules config keys into rule specs."""
+    specs = []
+    if "trip_distance" in cleaning:
+        specs.append({"name": "distance_out_of_range", "column": "trip_distance", **cleaning["trip_distance"]})
+    if "fare_amount" in cleaning:
+        specs.append({"name": "fare_negative", "column": "fare_amount", **cleaning["fare_amount"]})
+    specs.append({
+        "name": "invalid_time_order",
+        "expr": "tpep_dropoff_datetime >= tpep_pickup_datetime",
+        "enabled": cleaning.get("require_valid_time_order", True),
+    })
+    return specs
+
+
+def _compile_rule(spec: dict, bit: int) -> CleaningRule:
+    name = spec.get("name")
+    if not name:
+        raise RuleConfigError(f"Cleaning rule without a name: {spec}")
+
+    if "expr" in spec:
+        return CleaningRule(name=name, predicate=spec["expr"], description=spec["expr"], bit=bit)
+
+    column = spec.get("column")
+    lo, hi = spec.get("min"), spec.get("max")
+    if not column or (lo is None and hi is None):
+        raise RuleConfigError(f"Cleaning rule '{name}' needs either 'expr' or 'column' with 'min'/'max'")
+
+    if lo is not None and hi is not None:
+        predicate = f"{column} >= {lo} AND {column} <= {hi}"
+        description = f"{column} in [{lo}, {hi}]"
+    elif lo is not None:
+        predicate = f"{column} >= {lo}"
+        description = f"{column} >= {lo}"
+    else:
+        predicate = f"{column} <= {hi}"
+        description = f"{column} <= {hi}"
+    return CleaningRule(name=name, predicate=predicate, description=description, bit=bit, column=column)
+
+
+def load_rules(cfg: dict) -> list[CleaningRule]:
+    """
+    Compile the enabled rules under `cleaning.rules` (or the legacy
+    trip_distance / fare_amount / require_valid_time_order keys).
+    Bits are assigned in declaration order.
+    """
+    cleaning = cfg.get("cleaning", {})
+    specs = cleaning["rules"] if "rules" in cleaning else _legacy_rule_specs(cleaning)
+    specs = [s for s in specs if s.get("enabled", True)]
+
+    if len(specs) > MAX_RULES:
+        raise RuleConfigError(f"At most {MAX_RULES} cleaning rules are supported, got {len(specs)}")
+
+    rules = [_compile_rule(spec, bit) for bit, spec in enumerate(specs)]
+    names = [r.name for r in rules]
+    if len(set(names)) != len(names):
+        raise RuleConfigError(f"Duplicate cleaning rule names: {names}")
+    return rules
+
+
+def keep_predicate(rules: list[CleaningRule]) -> str:
+    """Conjunction of all rules, in a form DuckDB can push into the Parquet scan."""
+    if not rules:
+        return "TRUE"
+    return " AND ".join(f"({r.predicate})" for r in rules)
+
+
+def violation_mask_sql(rules: list[CleaningRule]) -> str:
+    """UBIGINT expression with bit `rule.bit` set for every rule the row breaks."""
+    if not rules:
+        return "0::UBIGINT"
+    terms = [f"CASE WHEN {r.violation_sql()} THEN {r.mask}::UBIGINT ELSE 0::UBIGINT END" for r in rules]
+    return " | ".join(terms)
+
+
+def rule_counts_query(
+    rules: list[CleaningRule],
+    source: str,
+    mask_expr: str | None = None,
+    kept_checks: list[str] | None = None,
+) -> str:
+    """
+    One aggregate over `source` returning (total, kept, <one count per rule>,
+    <one count per kept check>). `mask_expr` is the violation bitmask (an
+    already materialized column or the compiled expression); adding a rule
+    adds a column, not a scan. `kept_checks` are boolean expressions counted
+    over the kept rows only.
+    """
+    mask_expr = mask_expr or violation_mask_sql(rules)
+    per_rule = "".join(f",\n            COUNT_IF((_v & {r.mask}::UBIGINT) <> 0)" for r in rules)
+    per_check = "".join(f",\n            COUNT_IF(_v = 0 AND ({c}))" for c in kept_checks or [])
+    return f"""
+        SELECT
+            COUNT(*),
+            COUNT_IF(_v = 0){per_rule}{per_check}
+        FROM (SELECT *, {mask_expr} AS _v FROM {source})
+    """
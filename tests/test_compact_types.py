@@ -0,0 +1,60 @@
+import duckdb
+
+from src.transform.compact_types import TypeCast, compact_select, load_type_map, plan_casts
+from src.transform.rules import load_rules, rule_counts_query
+
+
+TYPE_MAP = {
+    "PULocationID": "SMALLINT",
+    "passenger_count": "UTINYINT",
+    "store_and_fwd_flag": "ENUM('N', 'Y')",
+    "fare_amount": "DECIMAL(9,2)",
+    "airport_fee": "DECIMAL(9,2)",
+}
+
+
+def test_load_type_map_respects_enabled():
+    assert load_type_map({"compact_types": {"enabled": False, "columns": TYPE_MAP}}) == {}
+    assert load_type_map({"compact_types": {"enabled": True, "columns": TYPE_MAP}}) == TYPE_MAP
+
+
+def test_plan_casts_matches_names_case_insensitively():
+    schema = [("PULocationID", "INTEGER"), ("Airport_fee", "DOUBLE"), ("fare_amount", "DECIMAL(9,2)")]
+    assert plan_casts(schema, TYPE_MAP) == [
+        TypeCast("PULocationID", "INTEGER", "SMALLINT"),
+        TypeCast("Airport_fee", "DOUBLE", "DECIMAL(9,2)"),
+    ]
+
+
+def test_lossy_values_counted_on_kept_rows_only():
+    con = duckdb.connect(database=":memory:")
+    con.execute("""
+        CREATE TABLE trips AS SELECT * FROM (VALUES
+            (1.0, 5.0, 1, 2, 'N', 1.5),
+            (2.0, 12.345, 1, 2, 'Y', 300.0),
+            (150.0, 7.0, 1, 2, 'X', 1.5),
+            (3.0, NULL, 1, 2, NULL, NULL)
+        ) t(trip_distance, fare_amount, pickup, dropoff, store_and_fwd_flag, passenger_count)
+    """)
+    rules = load_rules({"cleaning": {"rules": [{"name": "distance", "column": "trip_distance", "max": 100}]}})
+    casts = plan_casts([r[:2] for r in con.execute("DESCRIBE trips").fetchall()], TYPE_MAP)
+    row = con.execute(rule_counts_query(rules, "trips", kept_checks=[c.lossy_sql() for c in casts])).fetchone()
+
+    lossy = {c.column: n for c, n in zip(casts, row[3:])}
+    # 'X' is on a rejected row; 12.345 has sub-cent digits; 1.5 and 300 do not fit UTINYINT
+    assert lossy == {"store_and_fwd_flag": 0, "fare_amount": 1, "passenger_count": 2}
+    con.close()
+
+
+def test_compact_select_keeps_column_order():
+    con = duckdb.connect(database=":memory:")
+    sql = compact_select(
+        "SELECT 132 AS PULocationID, 'Y' AS store_and_fwd_flag, 9.5 AS fare_amount",
+        [TypeCast("PULocationID", "INTEGER", "SMALLINT"), TypeCast("store_and_fwd_flag", "VARCHAR", "ENUM('N', 'Y')")],
+    )
+    assert [(name, typ) for name, typ, *_ in con.execute(f"DESCRIBE {sql}").fetchall()] == [
+        ("PULocationID", "SMALLINT"),
+        ("store_and_fwd_flag", "ENUM('N', 'Y')"),
+        ("fare_amount", "DECIMAL(2,1)"),
+    ]
+    con.close()
@@ -0,0 +1,83 @@
+import duckdb
+import pytest
+
+from src.marts.cube import TRIP_LEVEL, build_cube, plan_cube_query, read_catalog, refresh_cube
+from src.marts.incremental import capture_affected_days, clear_affected_days
+
+
+TRIPS_SQL = """
+    SELECT
+        TIMESTAMP '{month}-01' + to_seconds(i * 97) AS tpep_pickup_datetime,
+        (i % 2 + 1)::INTEGER AS VendorID,
+        (i % 7 + 1)::INTEGER AS PULocationID,
+        (i % 5 + 1)::INTEGER AS DOLocationID,
+        (i % 3 + 1)::BIGINT AS payment_type,
+        CASE WHEN i % 11 = 0 THEN NULL ELSE (i % 4)::DOUBLE END AS passenger_count,
+        (i % 30)::DOUBLE + 0.25 AS total_amount,
+        (i % 25)::DOUBLE AS fare_amount,
+        1.5 AS tip_amount,
+        (i % 9)::DOUBLE / 2 AS trip_distance
+    FROM range({n}) t(i)
+"""
+
+
+def _answer(con, group_by, where=None, trip_level=False):
+    if trip_level:
+        con.execute("ALTER TABLE cube_catalog RENAME TO _hidden_catalog")
+    try:
+        plan = plan_cube_query(con, group_by, where)
+        return plan.source, sorted(con.execute(plan.sql, plan.params).fetchall(), key=str)
+    finally:
+        if trip_level:
+            con.execute("ALTER TABLE _hidden_catalog RENAME TO cube_catalog")
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect(database=":memory:")
+    con.execute(f"CREATE TABLE yellow_2023_01 AS {TRIPS_SQL.format(month='2023-01', n=5000)}")
+    con.execute(f"CREATE TABLE yellow_2023_02 AS {TRIPS_SQL.format(month='2023-02', n=4000)}")
+    build_cube(con)
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize(
+    "group_by, where",
+    [
+        (["payment_type", "passenger_count"], None),
+        (["pickup_hour"], {"payment_type": [1, 3]}),
+        (["PULocationID"], {"pickup_hour": ("2023-01-03", "2023-01-05")}),
+        ([], {"DOLocationID": 2}),
+    ],
+)
+def test_routed_queries_match_trip_level(con, group_by, where):
+    source, rows = _answer(con, group_by, where)
+    assert source != TRIP_LEVEL
+    assert rows == _answer(con, group_by, where, trip_level=True)[1]
+
+
+def test_routes_to_smallest_cuboid_and_falls_back(con):
+    sizes = {table: n for table, _, n in read_catalog(con)}
+    source = plan_cube_query(con, ["payment_type"]).source
+    assert sizes[source] == min(n for t, dims, n in read_catalog(con) if "payment_type" in dims)
+
+    # VendorID is not a cube dimension
+    assert plan_cube_query(con, ["VendorID"]).source == TRIP_LEVEL
+
+
+def test_refresh_after_reload_matches_rebuild(con):
+    capture_affected_days(con, "yellow_2023_02")
+    con.execute("DROP TABLE yellow_2023_02")
+    con.execute(f"CREATE TABLE yellow_2023_02 AS {TRIPS_SQL.format(month='2023-02', n=2500)}")
+    capture_affected_days(con, "yellow_2023_02")
+    refresh_cube(con)
+    clear_affected_days(con)
+
+    def contents():
+        return {t: sorted(con.execute(f"SELECT * FROM {t}").fetchall(), key=str) for t, _, _ in read_catalog(con)}
+
+    refreshed, refreshed_catalog = contents(), read_catalog(con)
+    build_cube(con)
+    assert refreshed == contents()
+    assert sorted(refreshed_catalog) == sorted(read_catalog(con))
@@ -0,0 +1,61 @@
+import os
+
+import duckdb
+
+from src.transform.dedup import build_keys_path, configure_spill, deduplicate, neighbour_months
+
+
+def test_neighbour_months_cross_year():
+    assert neighbour_months(2023, 1, 1) == [(2022, 12), (2023, 2)]
+    assert neighbour_months(2023, 12, 2) == [(2023, 10), (2023, 11), (2024, 1), (2024, 2)]
+
+
+def test_deduplicate_within_and_across_months(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    con = duckdb.connect(database=":memory:")
+    con.execute("""
+        CREATE TABLE src AS SELECT * FROM (VALUES
+            (1, 10.0, 'a'),
+            (1, 10.0, 'b'),
+            (2, 20.0, 'a'),
+            (3, 30.0, 'a')
+        ) t(trip_id, amount, note)
+    """)
+    cfg = {"key": ["trip_id", "amount"]}
+
+    # February first: near-duplicate (differs only outside the key) collapses to one row
+    sql, result = deduplicate(con, "SELECT * FROM src", 4, 2023, 2, cfg)
+    assert (result.within_month, result.cross_month) == (1, 0)
+    assert con.execute(f"SELECT COUNT(*) FROM ({sql})").fetchone()[0] == 3
+    assert (tmp_path / build_keys_path(2023, 2)).exists()
+
+    # March re-loads trip 3: it is already owned by February
+    con.execute("CREATE TABLE march AS SELECT * FROM src WHERE trip_id >= 3 UNION ALL SELECT 4, 40.0, 'a'")
+    sql, result = deduplicate(con, "SELECT * FROM march", 2, 2023, 3, cfg)
+    assert (result.within_month, result.cross_month) == (0, 1)
+    assert con.execute(f"SELECT trip_id FROM ({sql})").fetchall() == [(4,)]
+
+
+def test_deduplicate_spills_and_leaves_caller_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    spill = tmp_path / "spill"
+    con = duckdb.connect(database=":memory:")
+    configure_spill(con, {"temp_directory": str(spill)})
+    default_limit = con.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+
+    con.execute("CREATE TABLE src AS SELECT i % 2000000 AS trip_id, i AS amount FROM range(3000000) t(i)")
+    cfg = {"key": ["trip_id"], "memory_limit": "60MB"}
+
+    # Twice, like the long-lived watch connection: the second run starts on a connection that already spilled
+    for month in (1, 4):
+        sql, result = deduplicate(con, "SELECT * FROM src", 3_000_000, 2023, month, cfg)
+        assert result.within_month == 1_000_000
+        assert con.execute(f"SELECT COUNT(*) FROM ({sql})").fetchone()[0] == 2_000_000
+        assert con.execute("SELECT current_setting('memory_limit')").fetchone()[0] == default_limit
+    assert os.listdir(spill)
+
+    # A limit the caller chose is left as it is
+    con.execute("SET memory_limit = '3GB';")
+    chosen = con.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+    deduplicate(con, "SELECT * FROM src LIMIT 10", 10, 2023, 8, cfg)
+    assert con.execute("SELECT current_setting('memory_limit')").fetchone()[0] == chosen
@@ -0,0 +1,66 @@
+import csv
+import gzip
+
+import duckdb
+import pytest
+
+from src.export.stream import ExportError, as_query, export_query, infer_format
+
+
+def test_infer_format():
+    assert infer_format("out/hourly.csv") == "csv"
+    assert infer_format("out/hourly.csv.gz") == "csv"
+    assert infer_format("out/trips.parquet") == "parquet"
+    assert infer_format("out/trips.jsonl.zst") == "jsonl"
+    assert infer_format("out/trips.arrow") == "arrow"
+    with pytest.raises(ExportError):
+        infer_format("out/trips.xlsx")
+
+
+def test_as_query():
+    assert as_query("mart_hourly_demand") == "SELECT * FROM mart_hourly_demand"
+    assert as_query("  select 1") == "  select 1"
+    assert as_query("WITH x AS (SELECT 1) SELECT * FROM x").startswith("WITH")
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect(database=":memory:")
+    con.execute("CREATE TABLE trips AS SELECT i AS trip_id, i % 3 AS payment_type FROM range(10) r(i)")
+    yield con
+    con.close()
+
+
+def test_export_compressed_csv(con, tmp_path):
+    out = str(tmp_path / "trips.csv.gz")
+    export_query("SELECT * FROM trips ORDER BY trip_id", out, compression="gzip", con=con)
+    with gzip.open(out, "rt") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["trip_id", "payment_type"]
+    assert [r[0] for r in rows[1:]] == [str(i) for i in range(10)]
+
+
+def test_export_partitioned_parquet(con, tmp_path):
+    out = str(tmp_path / "parts")
+    export_query("trips", out, fmt="parquet", partition_by=["payment_type"], con=con)
+    n = con.execute(f"SELECT COUNT(*) FROM read_parquet('{out}/*/*.parquet', hive_partitioning = true)").fetchone()[0]
+    assert n == 10
+    assert (tmp_path / "parts" / "payment_type=0").is_dir()
+
+
+def test_rejects_unsupported_compression(con, tmp_path):
+    with pytest.raises(ExportError, match="not supported"):
+        export_query("trips", str(tmp_path / "t.parquet"), compression="lz4", con=con)
+
+
+def test_export_arrow_batches(con, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    out = str(tmp_path / "trips.arrow")
+    export_query("trips", out, batch_rows=4, con=con)
+    reader = pa.ipc.open_file(out)
+    assert reader.read_all().num_rows == 10
+
+
+def test_export_leaves_callers_settings_alone(con, tmp_path):
+    export_query("trips", str(tmp_path / "t.csv"), con=con)
+    assert con.execute("SELECT current_setting('preserve_insertion_order')").fetchone()[0] is True
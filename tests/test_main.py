@@ -3,7 +3,7 @@ from unittest.mock import patch
 
 import pytest
 
-from main import YearMonth, iter_months, parse_year_month, run_stage
+from main import QueuedStageRunner, YearMonth, iter_months, parse_year_month, queued_stages, run_stage, stages_for_all
 
 
 class TestParseYearMonth:
@@ -85,3 +85,48 @@ class TestRunStage:
     def test_unknown_stage_raises(self):
         with pytest.raises(ValueError, match="Unknown stage"):
             run_stage("unknown", YearMonth(2023, 1))
+
+    def test_transform_load_calls_run_transform_load(self):
+        with patch("main.run_transform_load") as m:
+            run_stage("transform_load", YearMonth(2023, 1))
+            m.assert_called_once_with(2023, 1)
+
+    def test_mart_rolling_calls_run_mart_rolling_demand(self):
+        with patch("main.run_mart_rolling_demand") as m:
+            run_stage("mart_rolling", YearMonth(2023, 1))
+            m.assert_called_once_with()
+        with patch("main.run_mart_rolling_demand") as m:
+            run_stage("mart_rolling_check", YearMonth(2023, 1))
+            m.assert_called_once_with(check=True)
+
+
+class TestStagesForAll:
+    def test_fused_by_default(self):
+        assert stages_for_all({}) == ["extract", "transform_load"]
+
+    def test_unfused_when_disabled(self):
+        cfg = {"pipeline": {"fuse_transform_load": False}}
+        assert stages_for_all(cfg) == ["extract", "transform", "load"]
+
+
+class TestQueuedStages:
+    def test_all_is_never_fused(self):
+        assert queued_stages("all") == ["extract", "transform", "load"]
+
+    def test_marts_cannot_be_queued(self):
+        with pytest.raises(SystemExit):
+            queued_stages("mart_daily")
+
+
+class TestQueuedStageRunner:
+    def test_snapshots_are_batched(self):
+        runner = QueuedStageRunner(publish_every=2)
+        with patch("main.run_stage"), patch("main.publish_snapshot") as publish:
+            for month in ("2023-01", "2023-02", "2023-03"):
+                runner(month, "transform")
+                runner(month, "load")
+            assert publish.call_count == 1
+            runner.finish()
+            assert publish.call_count == 2
+            runner.finish()
+            assert publish.call_count == 2
@@ -0,0 +1,34 @@
+import duckdb
+
+from src.quality.metrics import dq_trend, metric_value, profile_layer, write_dq_metrics
+
+
+def test_profile_layer_single_pass():
+    con = duckdb.connect(database=":memory:")
+    con.execute("""
+        CREATE TABLE t AS SELECT
+            TIMESTAMP '2023-01-01' AS tpep_pickup_datetime,
+            TIMESTAMP '2023-01-01' AS tpep_dropoff_datetime,
+            CASE WHEN i = 0 THEN NULL ELSE 1 END AS passenger_count,
+            i::DOUBLE AS trip_distance,
+            10.0::DOUBLE AS fare_amount,
+            12.0::DOUBLE AS total_amount,
+            1 AS PULocationID,
+            2 AS DOLocationID
+        FROM range(4) r(i)
+    """)
+    rows = profile_layer(con, "t", "2023-01", "raw")
+    assert metric_value(rows, "raw", "*", "rows") == 4
+    assert metric_value(rows, "raw", "passenger_count", "nulls") == 1
+    assert metric_value(rows, "raw", "passenger_count", "null_rate") == 0.25
+    assert metric_value(rows, "raw", "trip_distance", "max") == 3.0
+
+
+def test_write_replaces_month_and_trend_is_ordered(tmp_path):
+    path = str(tmp_path / "dq_metrics.parquet")
+    write_dq_metrics([("2023-02", "cleaned", "*", "removed_ratio", 0.2)], "2023-02", path)
+    write_dq_metrics([("2023-01", "cleaned", "*", "removed_ratio", 0.5)], "2023-01", path)
+    # Re-processing a month replaces its rows
+    write_dq_metrics([("2023-01", "cleaned", "*", "removed_ratio", 0.1)], "2023-01", path)
+
+    assert dq_trend("removed_ratio", path=path) == [("2023-01", 0.1), ("2023-02", 0.2)]
@@ -0,0 +1,132 @@
+import os
+
+import duckdb
+import pytest
+import yaml
+
+from src.config import CONFIG_PATH, load_config
+from src.quality.metrics import merge_profile_aggregates, profile_aggregates
+from src.transform import clean, parallel
+from src.transform.clean import apply_cleaning, run_transform
+from src.transform.compact_types import TypeCast
+from src.transform.parallel import (
+    RowSlice,
+    _clean_slice,
+    merge_cleaning_results,
+    parse_memory,
+    partition_sql,
+    plan_slices,
+    run_transform_parallel,
+)
+
+
+RAW_SQL = """
+    COPY (
+        SELECT
+            (i % 2 + 1)::INTEGER AS VendorID,
+            TIMESTAMP '2023-01-01' + to_seconds(i * 30) AS tpep_pickup_datetime,
+            TIMESTAMP '2023-01-01' + to_seconds(i * 30 + CASE WHEN i % 97 = 0 THEN -60 ELSE 600 END) AS tpep_dropoff_datetime,
+            CASE WHEN i % 13 = 0 THEN NULL ELSE (i % 5)::DOUBLE END AS passenger_count,
+            CASE WHEN i % 101 = 0 THEN 250.0 ELSE (i % 20)::DOUBLE END AS trip_distance,
+            CASE WHEN i % 89 = 0 THEN -3.0 ELSE (i % 40)::DOUBLE END AS fare_amount,
+            (i % 40 + 4)::DOUBLE AS total_amount,
+            (i % 265 + 1)::INTEGER AS PULocationID,
+            (i % 200 + 1)::INTEGER AS DOLocationID,
+            CASE WHEN i = 7000 THEN 1000 ELSE i % 4 + 1 END::BIGINT AS payment_type
+        -- copies of a trip sit in different row groups, so in different slices
+        FROM range(2) d(copy), range(10000) t(i)
+    ) TO '{path}' (FORMAT PARQUET, ROW_GROUP_SIZE 2048)
+"""
+
+
+def test_slices_merge_to_whole_file_counts(tmp_path):
+    raw_path = str(tmp_path / "yellow_tripdata_2023-01.parquet")
+    con = duckdb.connect(database=":memory:")
+    con.execute(RAW_SQL.format(path=raw_path))
+    casts = [TypeCast("payment_type", "BIGINT", "UTINYINT"), TypeCast("PULocationID", "INTEGER", "SMALLINT")]
+
+    rows = [r[0] for r in con.execute(f"""
+        SELECT row_group_num_rows
+        FROM (SELECT DISTINCT row_group_id, row_group_num_rows FROM parquet_metadata('{raw_path}'))
+        ORDER BY row_group_id
+    """).fetchall()]
+    slices = plan_slices(rows, 3)
+    assert len(slices) == 3
+
+    boundaries = ["2023-01-02", "2023-01-03 12:00:00"]
+    parts = [
+        _clean_slice(raw_path, 2023, 1, s, casts, partition_sql(None, boundaries), str(tmp_path), "256MiB", 1)
+        for s in slices
+    ]
+    merged = merge_cleaning_results([p[0] for p in parts], casts)
+
+    _, whole = apply_cleaning(
+        con, raw_path, 2023, 1, casts=casts, quarantine_path=str(tmp_path / "quarantine.parquet")
+    )
+    assert (merged.raw_count, merged.cleaned_count, merged.rule_counts) == (
+        whole.raw_count, whole.cleaned_count, whole.rule_counts
+    )
+    assert merged.casts == whole.casts == [casts[1]]
+    assert merged.skipped_casts == whole.skipped_casts == [(casts[0], 2)]
+
+    assert merge_profile_aggregates([p[1] for p in parts]) == profile_aggregates(con, f"'{raw_path}'")
+    # Every clean row lands in the partition of its pickup time
+    part_list = ", ".join(f"'{p[2]}/*/*.parquet'" for p in parts)
+    assert con.execute(f"""
+        SELECT COUNT(*), COUNT(*) FILTER (
+            WHERE _part <> (tpep_pickup_datetime >= '2023-01-02')::INT + (tpep_pickup_datetime >= '2023-01-03 12:00:00')::INT
+        )
+        FROM read_parquet([{part_list}], hive_partitioning = true)
+    """).fetchone() == (whole.cleaned_count, 0)
+    con.close()
+
+
+def _run_in(path, monkeypatch, step, cfg):
+    os.makedirs(path / "data" / "raw")
+    # Spawned workers load the config from their working directory
+    os.makedirs(path / "config")
+    with open(path / CONFIG_PATH, "w") as f:
+        yaml.safe_dump(cfg, f)
+    monkeypatch.chdir(path)
+    duckdb.execute(RAW_SQL.format(path="data/raw/yellow_tripdata_2023-01.parquet"))
+    step()
+
+
+def _report_body(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line for line in f if not line.startswith("Generated at:")]
+
+
+@pytest.mark.parametrize("key", [None, ["VendorID", "PULocationID", "DOLocationID", "fare_amount", "total_amount"]])
+def test_parallel_matches_transform(key, tmp_path, monkeypatch):
+    cfg = load_config()
+    if key is not None:
+        # Pickup time not in the key: partitions are hash ranges of the key instead
+        cfg["dedup"]["key"] = key
+        monkeypatch.setattr(clean, "dedup_config", cfg["dedup"])
+        monkeypatch.setattr(parallel, "dedup_config", cfg["dedup"])
+    serial, split = tmp_path / "serial", tmp_path / "parallel"
+    _run_in(serial, monkeypatch, lambda: run_transform(2023, 1), cfg)
+    _run_in(split, monkeypatch, lambda: run_transform_parallel(2023, 1, workers=3), cfg)
+    assert not os.path.exists(split / parallel.PARALLEL_DIR / "yellow_tripdata_2023-01")
+
+    for report in ("cleaning_report_2023-01.txt", "dq_report_2023-01.md"):
+        assert _report_body(serial / "data" / "cleaned" / report) == _report_body(split / "data" / "cleaned" / report)
+
+    con = duckdb.connect(database=":memory:")
+    for layer, name in (("cleaned", "yellow_tripdata_2023-01.parquet"), ("dedup_keys", "yellow_tripdata_2023-01.parquet")):
+        files = [f"'{root / 'data' / layer / name}'" for root in (serial, split)]
+        assert con.execute(f"DESCRIBE SELECT * FROM {files[0]}").fetchall() == con.execute(
+            f"DESCRIBE SELECT * FROM {files[1]}"
+        ).fetchall()
+        assert con.execute(
+            f"SELECT COUNT(*) FROM (SELECT * FROM {files[0]} EXCEPT ALL SELECT * FROM {files[1]})"
+        ).fetchone()[0] == 0
+        assert con.execute(f"SELECT COUNT(*) FROM {files[0]}").fetchone()[0] == con.execute(
+            f"SELECT COUNT(*) FROM {files[1]}"
+        ).fetchone()[0]
+
+    cleaned = split / "data" / "cleaned" / "yellow_tripdata_2023-01.parquet"
+    pickups = [r[0] for r in con.execute(f"SELECT tpep_pickup_datetime FROM '{cleaned}'").fetchall()]
+    assert pickups == sorted(pickups)
+    con.close()
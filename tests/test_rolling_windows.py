@@ -0,0 +1,44 @@
+import duckdb
+import pytest
+
+from src.marts.incremental import AFFECTED_DAYS_TABLE
+from src.marts.rolling_windows import (
+    build_mart_rolling_demand,
+    check_mart_rolling_demand,
+    refresh_mart_rolling_demand,
+)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect(database=":memory:")
+    con.execute("""
+        CREATE TABLE mart_daily_summary AS
+        SELECT TIMESTAMP '2023-01-01' + INTERVAL (i) DAY AS pickup_day, 10::BIGINT AS trips, 100.0 AS total_revenue
+        FROM range(120) r(i)
+    """)
+    yield con
+    con.close()
+
+
+def test_full_build_sums_trailing_days(con):
+    build_mart_rolling_demand(con, [7, 28, 90])
+    trips = con.execute("""
+        SELECT trips FROM mart_rolling_demand
+        WHERE window_days = 7 AND pickup_day IN (TIMESTAMP '2023-01-03', TIMESTAMP '2023-03-01')
+        ORDER BY pickup_day
+    """).fetchall()
+    assert trips == [(30,), (70,)]
+    assert check_mart_rolling_demand(con) == 0
+
+
+def test_incremental_refresh_matches_full_recompute(con):
+    build_mart_rolling_demand(con, [7, 28, 90])
+
+    # A reload changes two days; only windows overlapping them are recomputed
+    con.execute("UPDATE mart_daily_summary SET trips = 50 WHERE pickup_day IN ('2023-02-10', '2023-03-20')")
+    assert check_mart_rolling_demand(con) > 0
+
+    con.execute(f"CREATE TEMP TABLE {AFFECTED_DAYS_TABLE} AS SELECT pickup_day FROM (VALUES (TIMESTAMP '2023-02-10'), (TIMESTAMP '2023-03-20')) t(pickup_day)")
+    refresh_mart_rolling_demand(con)
+    assert check_mart_rolling_demand(con) == 0
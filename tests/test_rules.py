@@ -0,0 +1,81 @@
+import duckdb
+import pytest
+
+from src.transform.rules import (
+    RuleConfigError,
+    keep_predicate,
+    load_rules,
+    rule_counts_query,
+    violation_mask_sql,
+)
+
+
+CFG = {
+    "cleaning": {
+        "rules": [
+            {"name": "distance_out_of_range", "column": "trip_distance", "min": 0, "max": 100},
+            {"name": "fare_negative", "column": "fare_amount", "min": 0},
+            {"name": "invalid_time_order", "expr": "dropoff >= pickup"},
+            {"name": "disabled", "expr": "FALSE", "enabled": False},
+        ]
+    }
+}
+
+
+class TestLoadRules:
+    def test_compiles_enabled_rules_in_order(self):
+        rules = load_rules(CFG)
+        assert [r.name for r in rules] == ["distance_out_of_range", "fare_negative", "invalid_time_order"]
+        assert [r.bit for r in rules] == [0, 1, 2]
+        assert rules[0].predicate == "trip_distance >= 0 AND trip_distance <= 100"
+        assert rules[1].description == "fare_amount >= 0"
+        assert rules[2].column is None
+
+    def test_legacy_keys(self):
+        cfg = {
+            "cleaning": {
+                "trip_distance": {"min": 0, "max": 100},
+                "fare_amount": {"min": 0},
+                "require_valid_time_order": False,
+            }
+        }
+        assert [r.name for r in load_rules(cfg)] == ["distance_out_of_range", "fare_negative"]
+
+    def test_rule_without_bounds_raises(self):
+        with pytest.raises(RuleConfigError):
+            load_rules({"cleaning": {"rules": [{"name": "x", "column": "fare_amount"}]}})
+
+    def test_duplicate_names_raise(self):
+        spec = {"name": "x", "expr": "TRUE"}
+        with pytest.raises(RuleConfigError, match="Duplicate"):
+            load_rules({"cleaning": {"rules": [spec, spec]}})
+
+
+class TestRuleSql:
+    @pytest.fixture
+    def con(self):
+        con = duckdb.connect(database=":memory:")
+        con.execute("""
+            CREATE TABLE trips AS SELECT * FROM (VALUES
+                (1.0, 5.0, 1, 2),
+                (150.0, 5.0, 1, 2),
+                (150.0, -1.0, 1, 2),
+                (NULL, 5.0, 2, 1)
+            ) t(trip_distance, fare_amount, pickup, dropoff)
+        """)
+        yield con
+        con.close()
+
+    def test_counts_in_one_query(self, con):
+        rules = load_rules(CFG)
+        total, kept, dist, fare, time_order = con.execute(rule_counts_query(rules, "trips")).fetchone()
+        assert (total, kept) == (4, 1)
+        # NULL distance counts as a violation, matching the WHERE clause
+        assert (dist, fare, time_order) == (3, 1, 1)
+
+    def test_mask_and_keep_predicate_agree(self, con):
+        rules = load_rules(CFG)
+        masks = con.execute(f"SELECT {violation_mask_sql(rules)} FROM trips").fetchall()
+        assert [m[0] for m in masks] == [0, 1, 3, 5]
+        kept = con.execute(f"SELECT COUNT(*) FROM trips WHERE {keep_predicate(rules)}").fetchone()[0]
+        assert kept == 1
@@ -0,0 +1,58 @@
+import os
+
+import duckdb
+import pytest
+
+from src.load.snapshots import (
+    DB_PATH,
+    SNAPSHOT_DIR,
+    connect_reader,
+    current_snapshot_path,
+    publish_snapshot,
+    replace_table,
+)
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.dirname(DB_PATH))
+    con = duckdb.connect(DB_PATH)
+    con.execute("CREATE TABLE mart_daily_summary AS SELECT 1 AS trips")
+    con.close()
+    return tmp_path
+
+
+def test_replace_table_swaps_atomically():
+    con = duckdb.connect(database=":memory:")
+    con.execute("CREATE TABLE mart AS SELECT 1 AS v")
+    replace_table(con, "mart", "SELECT 2 AS v")
+    assert con.execute("SELECT v FROM mart").fetchall() == [(2,)]
+    tables = [r[0] for r in con.execute("SHOW TABLES").fetchall()]
+    assert tables == ["mart"]
+
+
+def test_publish_and_read_while_writer_is_open(warehouse):
+    assert current_snapshot_path() is None
+    first = publish_snapshot()
+    assert current_snapshot_path() == first
+
+    # A writer holding the working database does not block snapshot readers
+    writer = duckdb.connect(DB_PATH)
+    writer.execute("UPDATE mart_daily_summary SET trips = 2")
+    reader = connect_reader()
+    assert reader.execute("SELECT trips FROM mart_daily_summary").fetchall() == [(1,)]
+    reader.close()
+
+    second = publish_snapshot(con=writer)
+    writer.close()
+    reader = connect_reader()
+    assert reader.execute("SELECT trips FROM mart_daily_summary").fetchall() == [(2,)]
+    reader.close()
+    assert current_snapshot_path() == second
+
+
+def test_old_snapshots_are_collected(warehouse):
+    paths = [publish_snapshot(keep=2) for _ in range(4)]
+    remaining = sorted(os.path.join(SNAPSHOT_DIR, n) for n in os.listdir(SNAPSHOT_DIR))
+    assert remaining == paths[-2:]
@@ -0,0 +1,76 @@
+import os
+
+import duckdb
+import pytest
+
+from src.load.build_warehouse import DB_PATH, run_load
+from src.pipeline.transform_load import run_transform_load
+from src.transform.clean import run_transform
+
+
+RAW_SQL = """
+    COPY (
+        SELECT
+            (i % 2 + 1)::INTEGER AS VendorID,
+            TIMESTAMP '2023-01-01' + to_seconds(i * 30) AS tpep_pickup_datetime,
+            TIMESTAMP '2023-01-01' + to_seconds(i * 30 + CASE WHEN i % 97 = 0 THEN -60 ELSE 600 END) AS tpep_dropoff_datetime,
+            CASE WHEN i % 13 = 0 THEN NULL ELSE (i % 5)::DOUBLE END AS passenger_count,
+            CASE WHEN i % 101 = 0 THEN 250.0 ELSE (i % 20)::DOUBLE END AS trip_distance,
+            CASE WHEN i % 89 = 0 THEN -3.0 ELSE (i % 40)::DOUBLE END AS fare_amount,
+            (i % 40 + 4)::DOUBLE AS total_amount,
+            (i % 265 + 1)::INTEGER AS PULocationID,
+            (i % 200 + 1)::INTEGER AS DOLocationID,
+            (i % 4 + 1)::BIGINT AS payment_type
+        -- every trip twice, so dedup has work to do
+        FROM range(5000) t(i), range(2) d(copy)
+    ) TO 'data/raw/yellow_tripdata_2023-01.parquet' (FORMAT PARQUET)
+"""
+
+
+def _run_in(path, monkeypatch, steps):
+    os.makedirs(path / "data" / "raw")
+    monkeypatch.chdir(path)
+    duckdb.execute(RAW_SQL)
+    for step in steps:
+        step()
+
+
+def _report_body(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line for line in f if not line.startswith("Generated at:")]
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    _run_in(tmp_path / "separate", monkeypatch, [lambda: run_transform(2023, 1), lambda: run_load(2023, 1)])
+    _run_in(tmp_path / "fused", monkeypatch, [lambda: run_transform_load(2023, 1, write_cleaned=True)])
+    return tmp_path / "separate", tmp_path / "fused"
+
+
+def test_fused_matches_transform_then_load(outputs, tmp_path, monkeypatch):
+    separate, fused = outputs
+
+    for report in ("cleaning_report_2023-01.txt", "dq_report_2023-01.md"):
+        assert _report_body(separate / "data" / "cleaned" / report) == _report_body(fused / "data" / "cleaned" / report)
+
+    monkeypatch.chdir(tmp_path)
+    con = duckdb.connect(database=":memory:")
+    for root, alias in ((separate, "s"), (fused, "f")):
+        con.execute(f"ATTACH '{root / DB_PATH}' AS {alias} (READ_ONLY);")
+
+    counts = [con.execute(f"SELECT COUNT(*) FROM {a}.yellow_2023_01").fetchone()[0] for a in ("s", "f")]
+    assert counts[0] == counts[1] < 10000
+    assert con.execute(
+        "SELECT COUNT(*) FROM (SELECT * FROM s.yellow_2023_01 EXCEPT ALL SELECT * FROM f.yellow_2023_01)"
+    ).fetchone()[0] == 0
+
+    # Both paths expose the DQ metrics; the view resolves from any working directory
+    metrics = [con.execute(f"SELECT COUNT(*) FROM {a}.dq_metrics").fetchone()[0] for a in ("s", "f")]
+    assert metrics[0] == metrics[1] > 0
+
+    parquet = [f"'{root / 'data' / 'cleaned' / 'yellow_tripdata_2023-01.parquet'}'" for root in (separate, fused)]
+    assert con.execute(f"DESCRIBE SELECT * FROM {parquet[0]}").fetchall() == con.execute(
+        f"DESCRIBE SELECT * FROM {parquet[1]}"
+    ).fetchall()
+    assert con.execute(f"SELECT * FROM {parquet[0]}").fetchall() == con.execute(f"SELECT * FROM {parquet[1]}").fetchall()
+    con.close()
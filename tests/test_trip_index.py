@@ -0,0 +1,109 @@
+import os
+
+import duckdb
+import pytest
+
+from src.load.snapshots import DB_PATH, publish_snapshot
+from src.lookup import trip_index
+from src.lookup.trip_index import bloom_filter, bloom_may_contain, find_trips, write_cleaned_parquet
+
+
+TRIPS_SQL = """
+    SELECT
+        TIMESTAMP '{month}-01' + to_seconds(i * 60) AS tpep_pickup_datetime,
+        (i % 50 + 1)::SMALLINT AS PULocationID,
+        CASE WHEN i % 7 = 0 THEN NULL ELSE (i * 3 % 40 + 1) END::SMALLINT AS DOLocationID,
+        i::DOUBLE AS fare_amount
+    FROM range(20000) t(i)
+    ORDER BY random()
+"""
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = bloom_filter(range(1, 266, 2))
+    assert all(bloom_may_contain(bloom, v) for v in range(1, 266, 2))
+    assert sum(bloom_may_contain(bloom, v) for v in range(2, 266, 2)) < 20
+
+
+@pytest.fixture
+def cleaned(tmp_path, monkeypatch):
+    # No warehouse unless a test creates one under tmp_path
+    monkeypatch.chdir(tmp_path)
+    cleaned_dir = tmp_path / "cleaned"
+    cleaned_dir.mkdir()
+    monkeypatch.setattr(trip_index, "CLEANED_GLOB", str(cleaned_dir / "yellow_tripdata_*.parquet"))
+    monkeypatch.setattr(trip_index, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(trip_index, "index_settings", lambda: {"enabled": True, "row_group_size": 2048})
+
+    con = duckdb.connect(database=":memory:")
+    for month in ("2023-01", "2023-02"):
+        path = str(cleaned_dir / f"yellow_tripdata_{month}.parquet")
+        write_cleaned_parquet(con, TRIPS_SQL.format(month=month), path)
+    yield con, cleaned_dir
+    con.close()
+
+
+def _brute_force(con, cleaned_dir, where):
+    return con.execute(f"""
+        SELECT * FROM read_parquet('{cleaned_dir}/*.parquet')
+        WHERE {where}
+        ORDER BY tpep_pickup_datetime
+    """).fetchall()
+
+
+def test_lookup_prunes_and_matches_full_scan(cleaned):
+    con, cleaned_dir = cleaned
+    _, rows, stats = find_trips("2023-02-01 10:00", "2023-02-01 20:00", pu=12, con=con)
+
+    assert rows == _brute_force(
+        con, cleaned_dir,
+        "tpep_pickup_datetime >= '2023-02-01 10:00' AND tpep_pickup_datetime < '2023-02-01 20:00' AND PULocationID = 12",
+    )
+    assert len(rows) > 0
+    assert (stats.files_total, stats.files_scanned) == (2, 1)
+    assert stats.row_groups_scanned < stats.row_groups_total / 4
+
+
+def test_changed_file_is_scanned_in_full(cleaned):
+    con, cleaned_dir = cleaned
+    path = cleaned_dir / "yellow_tripdata_2023-01.parquet"
+    con.execute(f"COPY (SELECT * FROM '{path}' WHERE DOLocationID = 5) TO '{path}.new' (FORMAT PARQUET)")
+    os.replace(f"{path}.new", path)
+
+    _, rows, stats = find_trips(do=5, con=con)
+    assert rows == _brute_force(con, cleaned_dir, "DOLocationID = 5")
+    assert stats.files_scanned == 2
+
+
+def test_warehouse_only_months_are_read_from_the_snapshot(cleaned, capsys):
+    con, cleaned_dir = cleaned
+    os.makedirs(os.path.dirname(DB_PATH))
+    wh = duckdb.connect(DB_PATH)
+    # 2023-01 also has a cleaned file and must not be read twice; 2023-03 exists only here
+    for month in ("2023-01", "2023-03"):
+        wh.execute(f"CREATE TABLE yellow_{month.replace('-', '_')} AS {TRIPS_SQL.format(month=month)}")
+
+    # Nothing published yet and a writer holds the working file: cleaned files only, with a warning
+    _, rows, stats = find_trips(pu=12, con=con, warehouse=True)
+    assert rows == _brute_force(con, cleaned_dir, "PULocationID = 12")
+    assert stats.tables_scanned == 0
+    assert "no published warehouse snapshot" in capsys.readouterr().out
+
+    publish_snapshot(con=wh)
+    _, rows, stats = find_trips(pu=12, con=con, warehouse=True)
+    wh.close()
+
+    expected = con.execute(f"""
+        SELECT * FROM (
+            SELECT * FROM read_parquet('{cleaned_dir}/*.parquet')
+            UNION ALL BY NAME
+            SELECT * FROM ({TRIPS_SQL.format(month="2023-03")})
+        )
+        WHERE PULocationID = 12
+        ORDER BY tpep_pickup_datetime
+    """).fetchall()
+    assert rows == expected
+    assert (stats.files_scanned, stats.tables_scanned) == (2, 1)
+
+    # Not attached at all unless asked for (or cleaned files are switched off)
+    assert find_trips(pu=12, con=con, warehouse=False)[2].tables_scanned == 0
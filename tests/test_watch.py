@@ -0,0 +1,120 @@
+import os
+import signal
+import threading
+import time
+
+from src.pipeline import watch
+from src.pipeline.watch import RawDirPoller, SeenFiles, run_watch
+
+
+def _write(path, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_poller_waits_for_stable_signature(tmp_path):
+    poller = RawDirPoller(str(tmp_path))
+    _write(tmp_path / "yellow_tripdata_2023-01.parquet", b"abc")
+    _write(tmp_path / "notes.txt", b"ignored")
+
+    # First sighting only records the signature
+    assert poller.poll() == []
+    assert poller.poll() == [("yellow_tripdata_2023-01.parquet", 2023, 1)]
+
+    poller.mark_seen("yellow_tripdata_2023-01.parquet")
+    assert poller.poll() == []
+
+
+def test_poller_reports_changed_file_again(tmp_path):
+    path = tmp_path / "yellow_tripdata_2023-02.parquet"
+    _write(path, b"abc")
+    poller = RawDirPoller(str(tmp_path))
+    poller.prime({}, lambda y, m: (y, m) == (2023, 2))
+    assert poller.poll() == []
+
+    _write(path, b"abcdef")
+    os.utime(path, ns=(1, 1))
+    assert poller.poll() == []
+    assert poller.poll() == [("yellow_tripdata_2023-02.parquet", 2023, 2)]
+
+
+def test_prime_uses_recorded_signature(tmp_path):
+    path = tmp_path / "yellow_tripdata_2023-03.parquet"
+    _write(path, b"v1")
+    recorded = {path.name: (os.stat(path).st_size, os.stat(path).st_mtime_ns)}
+    _write(path, b"v2 replaced while stopped")
+
+    poller = RawDirPoller(str(tmp_path))
+    poller.prime(recorded, lambda y, m: True)
+    assert poller.poll() == []
+    assert poller.poll() == [(path.name, 2023, 3)]
+
+
+def _watch_until(processed, count, **kwargs):
+    """Run watch in this thread until `count` months were processed, then SIGINT it."""
+
+    finished = threading.Event()
+
+    def _stop_when_done():
+        deadline = time.time() + 10
+        while len(processed) < count and time.time() < deadline and not finished.is_set():
+            time.sleep(0.01)
+        if not finished.is_set():
+            os.kill(os.getpid(), signal.SIGINT)
+
+    stopper = threading.Thread(target=_stop_when_done)
+    stopper.start()
+    try:
+        run_watch(poll_interval=0.01, **kwargs)
+    finally:
+        finished.set()
+        stopper.join()
+
+
+def test_watch_reloads_file_replaced_while_stopped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(watch, "load_config", lambda: {})
+    monkeypatch.setattr(watch, "publish_snapshot", lambda con: None)
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    path = raw_dir / "yellow_tripdata_2023-01.parquet"
+    _write(path, b"v1")
+
+    processed = []
+
+    def fake_process_month(con, registry, year, month):
+        processed.append((year, month, path.read_bytes()))
+        registry.mark_done(f"{year}-{month:02d}", "load")
+        return True
+
+    monkeypatch.setattr(watch, "_process_month", fake_process_month)
+    kwargs = dict(
+        raw_dir=str(raw_dir),
+        registry_path=str(tmp_path / "registry" / "stage_status.json"),
+        seen_path=str(tmp_path / "registry" / "watch_seen.json"),
+    )
+
+    _watch_until(processed, 1, **kwargs)
+    assert processed == [(2023, 1, b"v1")]
+    assert SeenFiles(kwargs["seen_path"]).load() == {path.name: (2, os.stat(path).st_mtime_ns)}
+
+    _write(path, b"v2 replaced while stopped")
+    _watch_until(processed, 2, **kwargs)
+    assert processed[1:] == [(2023, 1, b"v2 replaced while stopped")]
+
+
+def test_worker_publishes_once_per_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(watch, "_process_month", lambda con, registry, year, month: True)
+    monkeypatch.setattr(watch, "publish_every", lambda: 3)
+    published = []
+    monkeypatch.setattr(watch, "publish_snapshot", lambda con: published.append(1))
+
+    work = watch.queue.Queue()
+    for month in range(1, 8):
+        work.put((f"yellow_tripdata_2023-{month:02d}.parquet", 2023, month, (1, 1)))
+    work.put(watch._STOP)
+    watch._worker(work, None, SeenFiles(str(tmp_path / "seen.json")))
+
+    # Two full batches of 3 while the backlog lasts, then one for the remaining month
+    assert len(published) == 3
@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import time
+
+from src.pipeline.work_queue import WorkQueue, run_worker
+
+
+MONTHS = ["2023-01", "2023-02", "2023-03", "2023-04"]
+
+
+def _recording_runner(log_path):
+    def runner(month_key, stage):
+        start = time.time()
+        time.sleep(0.05)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps([month_key, stage, start, time.time(), os.getpid()]) + "\n")
+    return runner
+
+
+def _worker_process(queue_path, log_path, worker_id):
+    q = WorkQueue(queue_path, lease_seconds=5, neighbour_lookback=1)
+    run_worker(q, _recording_runner(log_path), worker_id, poll_interval=0.01)
+
+
+def _overlap(a, b):
+    return a[2] < b[3] and b[2] < a[3]
+
+
+def test_workers_respect_dependencies_and_single_writer(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    log_path = str(tmp_path / "runs.jsonl")
+    WorkQueue(queue_path).enqueue(MONTHS, ["extract", "transform", "load"])
+
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker_process, args=(queue_path, log_path, f"w{i}")) for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    with open(log_path, encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f]
+    by_task = {(r[0], r[1]): r for r in runs}
+
+    # Every task ran exactly once, and work was spread over several processes
+    assert len(runs) == len(by_task) == len(MONTHS) * 3
+    assert len({r[4] for r in runs}) > 1
+    assert WorkQueue(queue_path).counts() == {"done": len(MONTHS) * 3}
+
+    for m in MONTHS:
+        assert by_task[(m, "extract")][3] <= by_task[(m, "transform")][2]
+        assert by_task[(m, "transform")][3] <= by_task[(m, "load")][2]
+
+    loads = [r for r in runs if r[1] == "load"]
+    assert not any(_overlap(a, b) for i, a in enumerate(loads) for b in loads[i + 1:])
+
+    # Adjacent months never transform concurrently (cross-month dedup)
+    for a, b in zip(MONTHS, MONTHS[1:]):
+        assert not _overlap(by_task[(a, "transform")], by_task[(b, "transform")])
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    q = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.2)
+    q.enqueue(["2023-01"], ["extract"])
+
+    task = q.claim("a")
+    assert task.attempt == 1
+    assert q.claim("b") is None
+
+    time.sleep(0.3)
+    retry = q.claim("b")
+    assert (retry.month, retry.stage, retry.attempt) == ("2023-01", "extract", 2)
+
+    # The old owner lost the task and cannot complete it any more
+    assert not q.heartbeat(task, "a")
+    assert not q.complete(task, "a")
+    assert q.complete(retry, "b")
+    assert q.counts() == {"done": 1}
+
+
+def test_failed_task_retries_until_max_attempts(tmp_path):
+    q = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    q.enqueue(["2023-01"], ["extract"])
+
+    q.fail(q.claim("a"), "a", "boom")
+    assert q.counts() == {"pending": 1}
+    q.fail(q.claim("a"), "a", "boom")
+    assert q.counts() == {"failed": 1}
+
+    # Re-enqueueing resets failed tasks
+    assert q.enqueue(["2023-01"], ["extract"]) == 1
+    assert q.counts() == {"pending": 1}
+
+
+def test_failed_stage_blocks_later_stages_and_worker_exits(tmp_path):
+    q = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=1)
+    q.enqueue(["2023-01", "2023-02"], ["transform", "load"])
+    ran = []
+
+    def runner(month, stage):
+        if (month, stage) == ("2023-01", "transform"):
+            raise RuntimeError("boom")
+        ran.append((month, stage))
+
+    counts = run_worker(q, runner, "a", poll_interval=0.01)
+
+    assert counts == {"done": 2, "failed": 2}
+    assert ran == [("2023-02", "transform"), ("2023-02", "load")]
+    con = q._connect()
+    try:
+        error = con.execute("SELECT error FROM tasks WHERE month = '2023-01' AND stage = 'load'").fetchone()[0]
+    finally:
+        con.close()
+    assert error == "blocked by transform"